@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update
+
+import config
+import metrics
+import tracing
+from models import Conversations, Queries
+
+logger = logging.getLogger(__name__)
+
+# Cold conversations keep their row in the hot database (marked with
+# archive_month) so ownership checks, titles and history ordering are
+# unchanged; only their queries move out, into one SQLite file per month of
+# last activity, one zlib-compressed JSON payload per conversation.
+QUERY_COLUMNS = [column.name for column in Queries.__table__.columns]
+DATETIME_COLUMNS = ("create_at", "updated_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    archived_at TEXT NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS query_ids (
+    id INTEGER PRIMARY KEY,
+    conversation_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_query_ids_conversation ON query_ids (conversation_id);
+"""
+
+
+def archive_file(month: str) -> str:
+    return os.path.join(config.ARCHIVE_DIR, f"conversations-{month}.db")
+
+
+def _connect(month: str, create: bool = False):
+    path = archive_file(month)
+    if not create and not os.path.exists(path):
+        return None
+    if create:
+        os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+    conn = sqlite3.connect(path)
+    if create:
+        conn.executescript(SCHEMA)
+    return conn
+
+
+def _encode(rows: list) -> bytes:
+    payload = {"columns": QUERY_COLUMNS, "rows": [[row[name] for name in QUERY_COLUMNS] for row in rows]}
+    return zlib.compress(json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8"))
+
+
+# Columns added to Queries after a payload was written fall back to their defaults
+def _decode(blob: bytes) -> list:
+    payload = json.loads(zlib.decompress(blob))
+    rows = []
+    for values in payload["rows"]:
+        row = {name: value for name, value in zip(payload["columns"], values) if name in QUERY_COLUMNS}
+        for name in DATETIME_COLUMNS:
+            if row.get(name):
+                row[name] = datetime.fromisoformat(row[name])
+        rows.append(row)
+    return rows
+
+
+# entries: (conversation_id, user_id, query rows as dicts)
+def write(month: str, entries: list):
+    archived_at = datetime.utcnow().isoformat()
+    with closing(_connect(month, create=True)) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO conversations (id, user_id, archived_at, payload) VALUES (?, ?, ?, ?)",
+            [(cid, user_id, archived_at, _encode(rows)) for cid, user_id, rows in entries]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO query_ids (id, conversation_id) VALUES (?, ?)",
+            [(row["id"], cid) for cid, _, rows in entries for row in rows]
+        )
+
+
+def read(month: str, conversation_ids: list) -> dict:
+    conn = _connect(month)
+    if conn is None or not conversation_ids:
+        return {}
+    with closing(conn), tracing.span("archive.read", month=month, conversations=len(conversation_ids)):
+        placeholders = ",".join("?" * len(conversation_ids))
+        rows = conn.execute(f"SELECT id, payload FROM conversations WHERE id IN ({placeholders})", list(conversation_ids))
+        metrics.incr("archive.reads")
+        return {cid: _decode(payload) for cid, payload in rows}
+
+
+def remove(month: str, conversation_ids: list):
+    conn = _connect(month)
+    if conn is None or not conversation_ids:
+        return
+    placeholders = ",".join("?" * len(conversation_ids))
+    with closing(conn), conn:
+        conn.execute(f"DELETE FROM conversations WHERE id IN ({placeholders})", list(conversation_ids))
+        conn.execute(f"DELETE FROM query_ids WHERE conversation_id IN ({placeholders})", list(conversation_ids))
+
+
+def _group_by_month(conversations) -> dict:
+    by_month = {}
+    for convo in conversations:
+        if convo.archive_month:
+            by_month.setdefault(convo.archive_month, []).append(convo.id)
+    return by_month
+
+
+# Move the queries of conversations untouched for ARCHIVE_AFTER_DAYS out of
+# the hot tables, a batch at a time. The archive copy is written first, and a
+# conversation is only marked archived (and its queries deleted) if nothing
+# wrote to it in between: it must still be cold (any write to the row moves
+# updated_at) and have no query newer than the ones copied. Both are checked in
+# SQL against stored values, since a timestamp read back and bound again does
+# not compare equal to what SQLite stored.
+def archive_cold_conversations(session) -> int:
+    if config.ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+
+    cutoff = datetime.utcnow() - timedelta(days=config.ARCHIVE_AFTER_DAYS)
+    has_queries = session.query(Queries.id).filter(Queries.conversation_id == Conversations.id).exists()
+    total = 0
+    while True:
+        cold = (
+            session.query(Conversations.id, Conversations.user_id, Conversations.updated_at)
+            .filter(Conversations.archive_month.is_(None), Conversations.updated_at < cutoff, has_queries)
+            .order_by(Conversations.id)
+            .limit(config.ARCHIVE_BATCH_SIZE)
+            .all()
+        )
+        if not cold:
+            break
+
+        rows_by_convo = {convo.id: [] for convo in cold}
+        for q in session.query(Queries).filter(Queries.conversation_id.in_(rows_by_convo)):
+            rows_by_convo[q.conversation_id].append({name: getattr(q, name) for name in QUERY_COLUMNS})
+
+        entries_by_month = {}
+        for convo in cold:
+            entries_by_month.setdefault(convo.updated_at.strftime("%Y-%m"), []).append(
+                (convo.id, convo.user_id, rows_by_convo[convo.id])
+            )
+        for month, entries in entries_by_month.items():
+            write(month, entries)
+
+        skipped = {}
+        for month, entries in entries_by_month.items():
+            for cid, _, rows in entries:
+                newer_queries = (
+                    session.query(Queries.id)
+                    .filter(Queries.conversation_id == cid, Queries.id > max(row["id"] for row in rows))
+                    .exists()
+                )
+                result = session.execute(
+                    update(Conversations)
+                    .where(
+                        Conversations.id == cid,
+                        Conversations.archive_month.is_(None),
+                        Conversations.updated_at < cutoff,
+                        ~newer_queries
+                    )
+                    .values(archive_month=month, updated_at=Conversations.updated_at)
+                )
+                if result.rowcount:
+                    session.query(Queries).filter(Queries.conversation_id == cid).delete(synchronize_session=False)
+                    total += 1
+                else:
+                    skipped.setdefault(month, []).append(cid)
+        session.commit()
+
+        for month, ids in skipped.items():
+            remove(month, ids)
+        if len(cold) < config.ARCHIVE_BATCH_SIZE:
+            break
+        time.sleep(config.GC_BATCH_PAUSE)
+
+    return total
+
+
+# Put archived rows back under their own ids. A database archived before
+# queries stopped reusing ids may have handed some of them out since; those
+# conversations are restored under new ids, parents and head remapped (rows
+# are in id order, so a parent always comes before its children).
+def _restore(session, cid: int, rows: list):
+    taken = session.query(Queries.id).filter(Queries.id.in_([row["id"] for row in rows])).first()
+    if taken is None:
+        session.execute(insert(Queries), rows)
+        return
+
+    new_ids = {}
+    for row in sorted(rows, key=lambda row: row["id"]):
+        values = {name: value for name, value in row.items() if name != "id"}
+        values["parent_id"] = new_ids.get(row["parent_id"], row["parent_id"])
+        new_ids[row["id"]] = session.execute(insert(Queries).values(**values)).inserted_primary_key[0]
+    head = session.query(Conversations.head_query_id).filter(Conversations.id == cid).scalar()
+    if head in new_ids:
+        session.execute(
+            update(Conversations)
+            .where(Conversations.id == cid)
+            .values(head_query_id=new_ids[head], updated_at=Conversations.updated_at)
+        )
+    logger.warning("Restored archived conversation %s under new query ids", cid)
+
+
+# Bring archived conversations back into the hot tables before they are
+# continued. Whoever clears archive_month first restores the queries, so
+# concurrent requests for the same conversation restore it once.
+def rehydrate(session, conversations: list):
+    by_month = _group_by_month(conversations)
+    if not by_month:
+        return
+
+    with tracing.span("archive.rehydrate", conversations=sum(len(ids) for ids in by_month.values())):
+        for month, ids in by_month.items():
+            payloads = read(month, ids)
+            for cid in ids:
+                claimed = session.execute(
+                    update(Conversations)
+                    .where(Conversations.id == cid, Conversations.archive_month == month)
+                    .values(archive_month=None, updated_at=Conversations.updated_at)
+                ).rowcount
+                if not claimed:
+                    continue
+                if payloads.get(cid):
+                    _restore(session, cid, payloads[cid])
+                else:
+                    logger.warning("Archived conversation %s is missing from %s", cid, archive_file(month))
+        session.commit()
+
+    for month, ids in by_month.items():
+        remove(month, ids)
+    metrics.incr("archive.rehydrated", sum(len(ids) for ids in by_month.values()))
+
+
+# Queries of archived conversations for read-only use, without moving them
+def archived_queries(conversations: list) -> dict:
+    queries_by_conversation = {}
+    for month, ids in _group_by_month(conversations).items():
+        for cid, rows in read(month, ids).items():
+            queries_by_conversation[cid] = [Queries(**row) for row in rows]
+    return queries_by_conversation
+
+
+# Archived conversation of the user that holds query_id, if any
+def find_conversation(session, user_id: int, query_id: int):
+    months = [
+        month for (month,) in session.query(Conversations.archive_month)
+        .filter(Conversations.user_id == user_id, Conversations.archive_month.isnot(None))
+        .distinct()
+    ]
+    for month in months:
+        conn = _connect(month)
+        if conn is None:
+            continue
+        with closing(conn):
+            row = conn.execute("SELECT conversation_id FROM query_ids WHERE id = ?", (query_id,)).fetchone()
+        if row:
+            return (
+                session.query(Conversations)
+                .filter_by(id=row[0], user_id=user_id)
+                .filter(Conversations.archive_month.isnot(None))
+                .first()
+            )
+    return None
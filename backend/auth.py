@@ -1,65 +1,107 @@
-import os 
 import time
+import logging
+import secrets
 import bcrypt
 import jwt
-from typing import Dict
+from datetime import datetime
+from typing import Dict, Optional
 from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv
-from models import Users, get_db, RevokedToken
+from models import Users, get_db, RevokedToken, Session as SessionLocal
+import tracing
+from config import JWT_SECRET, JWT_ALGORITHM, ACCESS_TOKEN_TTL, REFRESH_TOKEN_TTL, REVOCATION_BUCKET_SECONDS, ADMIN_EMAILS
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-JWT_SECRET = os.getenv("secret")
-JWT_ALGORITHM = os.getenv("algorithm")
 
-
-def token_response(token: str):
+def token_response(access_token: str, refresh_token: str):
     return {
-        "access_token": token
+        "access_token": access_token,
+        "refresh_token": refresh_token
     }
 
-def signJWT(user_id: int) -> Dict[str, str]:
+def create_token(user_id: int, token_type: str, ttl: int) -> str:
+    now = int(time.time())
     payload = {
         "user_id": user_id,
-        "expires": time.time() + 2400  #(40 minutes) 
+        "type": token_type,
+        "jti": secrets.token_urlsafe(9),
+        "iat": now,
+        "exp": now + ttl
     }
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
-    return token_response(token)
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def signJWT(user_id: int) -> Dict[str, str]:
+    return token_response(
+        create_token(user_id, "access", ACCESS_TOKEN_TTL),
+        create_token(user_id, "refresh", REFRESH_TOKEN_TTL)
+    )
 
-def decodeJWT(token: str) -> dict:
+
+def decodeJWT(token: str) -> Optional[dict]:
     try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        print("DECODED JWT:", decoded_token)
-        if decoded_token["expires"] >= time.time():
-            return decoded_token
-        else:
-            print("Token expired")
-            return None
+        # PyJWT rejects tokens past their "exp" claim
+        decoded_token = jwt.decode(
+            token, JWT_SECRET, algorithms=[JWT_ALGORITHM],
+            options={"require": ["exp", "jti"]}
+        )
+        return decoded_token
+    except jwt.ExpiredSignatureError:
+        logger.info("Token expired")
+        return None
     except Exception as e:
-        print("JWT Decode error:", str(e))
-        return {}
+        logger.info("JWT decode error: %s", e)
+        return None
+
+
+# Revocations are partitioned by the hour the token expires in, so whole
+# buckets can be dropped once every token in them has expired
+def revocation_bucket(exp: int) -> int:
+    return int(exp) // REVOCATION_BUCKET_SECONDS
+
+def revoke_token(session: Session, payload: dict):
+    exists = session.query(RevokedToken.id).filter_by(
+        bucket=revocation_bucket(payload["exp"]), jti=payload["jti"]
+    ).first()
+    if not exists:
+        session.add(RevokedToken(
+            jti=payload["jti"],
+            bucket=revocation_bucket(payload["exp"]),
+            expires_at=datetime.utcfromtimestamp(payload["exp"])
+        ))
+
+def is_revoked(session: Session, payload: dict) -> bool:
+    return session.query(RevokedToken.id).filter_by(
+        bucket=revocation_bucket(payload["exp"]), jti=payload["jti"]
+    ).first() is not None
 
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
 
     async def __call__(self, request: Request):
+        with tracing.span("auth.verify"):
+            return await self._verify(request)
+
+    async def _verify(self, request: Request):
         credentials: HTTPAuthorizationCredentials = await super(JWTBearer, self).__call__(request)
         if credentials:
             if credentials.scheme != "Bearer":
                 raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
-            
+
+            payload = decodeJWT(credentials.credentials)
+            if not payload or payload.get("type") != "access":
+                raise HTTPException(status_code=403, detail="Invalid or expired token.")
+
             # 🔸 Check revoked tokens
-            db: Session = next(get_db())
-            revoked = db.query(RevokedToken).filter_by(token=credentials.credentials).first()
+            db = SessionLocal()
+            try:
+                revoked = is_revoked(db, payload)
+            finally:
+                db.close()
             if revoked:
                 raise HTTPException(status_code=403, detail="Token has been revoked.")
-
-            if not self.verify_jwt(credentials.credentials):
-                raise HTTPException(status_code=403, detail="Invalid or expired token.")
             
             return credentials.credentials
         else:
@@ -86,10 +128,18 @@ def get_current_user(
     if not payload or "user_id" not in payload:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    user = session.query(Users).filter_by(id=payload["user_id"]).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    session.refresh(user)
+    with tracing.span("auth.load_user", user_id=payload["user_id"]):
+        user = session.query(Users).filter_by(id=payload["user_id"]).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        session.refresh(user)
     
     return user
+
+
+# Admins are listed by email in ADMIN_EMAILS
+def get_admin_user(current_user: Users = Depends(get_current_user)):
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
@@ -0,0 +1,41 @@
+from typing import List, Optional
+
+from sqlalchemy import select, literal
+from sqlalchemy.orm import Session
+
+from models import Queries
+
+
+# Walk parent pointers from a node up to the root with a recursive CTE,
+# returning the rows root-first. Cost is proportional to the branch depth,
+# not to the number of sibling branches in the conversation.
+def ancestor_path(session: Session, query_id: Optional[int]) -> List[Queries]:
+    if query_id is None:
+        return []
+
+    q = Queries.__table__
+    path = (
+        select(q.c.id, q.c.parent_id, literal(0).label("depth"))
+        .where(q.c.id == query_id)
+        .cte("path", recursive=True)
+    )
+    parent = path.alias()
+    path = path.union_all(
+        select(q.c.id, q.c.parent_id, parent.c.depth + 1)
+        .where(q.c.id == parent.c.parent_id)
+    )
+
+    return (
+        session.query(Queries)
+        .join(path, Queries.id == path.c.id)
+        .order_by(path.c.depth.desc())
+        .all()
+    )
+
+
+def path_messages(path: List[Queries]) -> list:
+    messages = []
+    for q in path:
+        messages.append({"role": "user", "content": q.query_text})
+        messages.append({"role": "assistant", "content": q.response_text})
+    return messages
@@ -1,2 +1,111 @@
+import os
+import logging
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Environment is read once, here, and every other module imports from this file
+load_dotenv()
+
 FRONTEND_URL = "http://localhost:8000" 
-# FRONTEND_URL = ""
\ No newline at end of file
+# FRONTEND_URL = ""
+
+# Database. DATABASE_READ_URL points history/usage reads at a replica; unset,
+# they use a second, read-only pool on the primary (SQLite in WAL mode lets
+# those readers run alongside the writer).
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///app.db")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or DATABASE_URL
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))  # seconds a user's reads stay on the primary after a write
+
+# Auth
+JWT_SECRET = os.getenv("secret")
+JWT_ALGORITHM = os.getenv("algorithm")
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", "900"))  # (15 minutes)
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", "604800"))  # (7 days)
+REVOCATION_BUCKET_SECONDS = 3600
+
+# LLM upstream
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+# Extra LLM backends and routing
+LOCAL_LLM_URL = os.getenv("LOCAL_LLM_URL")  # e.g. http://localhost:8080/v1/chat/completions
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "local")
+LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY")
+FAKE_LLM = os.getenv("FAKE_LLM", "0") == "1"
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+LLM_ROUTING = [name.strip() for name in os.getenv("LLM_ROUTING", "openrouter").split(",") if name.strip()]
+LLM_STATS_ALPHA = float(os.getenv("LLM_STATS_ALPHA", "0.2"))
+LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", "3"))
+LLM_COOLDOWN = float(os.getenv("LLM_COOLDOWN", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+LLM_SATURATION = int(os.getenv("LLM_SATURATION", str(HTTP_POOL_SIZE)))
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "32000"))
+
+# Response post-processing (transforms: think, think_lead, boxed, pii, markdown)
+POSTPROCESS_DEFAULT = os.getenv("POSTPROCESS_DEFAULT", "think,boxed,markdown")
+POSTPROCESS_MODELS = os.getenv("POSTPROCESS_MODELS", "")  # "model=think,pii;r1-model=think,think_lead,markdown"
+
+# Batch queries
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_INSERT_SIZE = int(os.getenv("BATCH_INSERT_SIZE", "50"))
+
+# Conversation titles
+TITLE_BACKEND = os.getenv("TITLE_BACKEND")  # routed like any other call when unset
+TITLE_MODEL = os.getenv("TITLE_MODEL")  # the backend's default model when unset
+TITLE_WORKERS = int(os.getenv("TITLE_WORKERS", "2"))
+TITLE_FLUSH_SIZE = int(os.getenv("TITLE_FLUSH_SIZE", "20"))
+TITLE_FLUSH_INTERVAL = float(os.getenv("TITLE_FLUSH_INTERVAL", "5"))
+
+# Tracing and logging (TRACE_EXPORTER: none, file or otlp)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_URL = os.getenv("TRACE_OTLP_URL", "http://localhost:4318/v1/traces")
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "256"))
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "1"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+# Usage ledger and quotas (0 disables a limit). ADMIN_EMAILS is comma separated.
+QUOTA_REQUESTS_PER_MINUTE = int(os.getenv("QUOTA_REQUESTS_PER_MINUTE", "0"))
+QUOTA_TOKENS_PER_DAY = int(os.getenv("QUOTA_TOKENS_PER_DAY", "0"))
+USAGE_MINUTE_RETENTION = int(os.getenv("USAGE_MINUTE_RETENTION", "172800"))  # (2 days)
+USAGE_HOUR_RETENTION = int(os.getenv("USAGE_HOUR_RETENTION", "7776000"))  # (90 days)
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+# Lifespan
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+WARMUP_RECENT_CONVERSATIONS = int(os.getenv("WARMUP_RECENT_CONVERSATIONS", "0"))
+
+# Background maintenance (GC_INTERVAL=0 disables it)
+GC_INTERVAL = float(os.getenv("GC_INTERVAL", "900"))
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", "500"))
+GC_BATCH_PAUSE = float(os.getenv("GC_BATCH_PAUSE", "0.05"))
+GC_VACUUM_PAGES = int(os.getenv("GC_VACUUM_PAGES", "1000"))
+EMPTY_CONVERSATION_GRACE = int(os.getenv("EMPTY_CONVERSATION_GRACE", "3600"))
+HISTORY_TOMBSTONE_RETENTION = int(os.getenv("HISTORY_TOMBSTONE_RETENTION", "2592000"))  # (30 days)
+
+# Archival of cold conversations into one compressed SQLite file per month
+# (ARCHIVE_AFTER_DAYS=0 disables it)
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+
+
+def validate_config():
+    missing = [name for name, value in (
+        ("secret", JWT_SECRET),
+        ("algorithm", JWT_ALGORITHM),
+    ) if not value]
+    if missing:
+        raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+
+    if not (OPENROUTER_API_URL or LOCAL_LLM_URL or FAKE_LLM):
+        logger.warning("No LLM backend configured (OPENROUTER_API_URL, LOCAL_LLM_URL or FAKE_LLM=1), /query calls will fail")
+    elif OPENROUTER_API_URL and not OPENROUTER_API_KEY:
+        logger.warning("OPENROUTER_API_KEY is not set, OpenRouter calls will fail")
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable
+
+from fastapi import Request, Depends
+from sqlalchemy import update, insert, select
+
+from models import Users, Conversations, ConversationTombstone, Session, ReadSession
+from auth import get_current_user
+from config import DATABASE_URL, DATABASE_READ_URL, READ_YOUR_WRITES_WINDOW
+import metrics
+
+
+# Every write that changes what GET /query/history returns bumps the owner's
+# version, so validating a cached copy costs one column read instead of a rebuild.
+# The conversations it touched are stamped with the new version, and deleted
+# ones (conversation_id, user_id) leave a tombstone carrying it, which is what
+# ?since_version= deltas read. Callers commit.
+def bump_history_version(session, user_ids: Iterable[int], conversation_ids: Iterable[int] = (), deleted: Iterable[tuple] = ()):
+    deleted = list(deleted)
+    user_ids = list(set(user_ids) | {user_id for _, user_id in deleted})
+    if not user_ids:
+        return
+    session.execute(
+        update(Users)
+        .where(Users.id.in_(user_ids))
+        .values(history_version=Users.history_version + 1, history_updated_at=datetime.utcnow())
+    )
+
+    conversation_ids = list(set(conversation_ids))
+    if conversation_ids:
+        owner_version = select(Users.history_version).where(Users.id == Conversations.user_id).scalar_subquery()
+        session.execute(
+            update(Conversations)
+            .where(Conversations.id.in_(conversation_ids))
+            .values(changed_version=owner_version)
+        )
+    for conversation_id, user_id in deleted:
+        session.execute(
+            insert(ConversationTombstone).values(
+                user_id=user_id,
+                conversation_id=conversation_id,
+                version=select(Users.history_version).where(Users.id == user_id).scalar_subquery(),
+                deleted_at=datetime.utcnow()
+            )
+        )
+
+
+def history_etag(user: Users) -> str:
+    return f'W/"h{user.id}-{user.history_version or 0}"'
+
+
+def history_last_modified(user: Users) -> datetime:
+    updated_at = user.history_updated_at or user.create_at or datetime.utcnow()
+    return updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+# The user's row as seen by the session serving the response. Validators (and
+# the delta version) come from it, read before the body, so a lagging replica
+# never pairs a new ETag with stale rows; at worst the body is a little newer
+# than its ETag and the next request fetches it again. None if the replica
+# does not have the user yet, which disables caching for that response.
+def serving_user(session, current_user: Users):
+    return session.get(Users, current_user.id)
+
+
+def cache_headers(user) -> dict:
+    if user is None:
+        return {"Cache-Control": "no-store"}
+    return {
+        "ETag": history_etag(user),
+        "Last-Modified": format_datetime(history_last_modified(user), usegmt=True),
+        "Cache-Control": "private, no-cache"
+    }
+
+
+def is_not_modified(request: Request, user) -> bool:
+    if user is None:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return history_etag(user) in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return history_last_modified(user) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+# A replica may lag behind the primary, so for a short window after a user's
+# own write their reads stay on the primary and they always see what they just
+# asked. Without a replica the read pool shares the primary's file and never lags.
+def recently_written(user: Users) -> bool:
+    if DATABASE_READ_URL == DATABASE_URL or user.history_updated_at is None:
+        return False
+    return datetime.utcnow() - user.history_updated_at < timedelta(seconds=READ_YOUR_WRITES_WINDOW)
+
+
+# Session for read-only handlers (history, usage)
+def get_history_db(current_user: Users = Depends(get_current_user)):
+    if recently_written(current_user):
+        metrics.incr("db.reads.primary")
+        db = Session()
+    else:
+        metrics.incr("db.reads.replica")
+        db = ReadSession()
+    try:
+        yield db
+    finally:
+        db.close()
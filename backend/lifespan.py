@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import signal
+import threading
+from contextlib import asynccontextmanager
+
+from sqlalchemy import text
+
+import config
+import llm
+import maintenance
+import pages
+import tracing
+from models import engine, read_engine, Session, Queries, Conversations
+
+logger = logging.getLogger(__name__)
+
+_shutdown_hooks = []
+
+
+# Register a callable that flushes buffered work before the process exits
+def on_shutdown(hook):
+    _shutdown_hooks.append(hook)
+    return hook
+
+
+# Counts requests that must finish before shutdown
+class InFlightTracker:
+    def __init__(self):
+        self._count = 0
+        self._cond = threading.Condition()
+        self.draining = False
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def enter(self):
+        with self._cond:
+            self._count += 1
+
+    def exit(self):
+        with self._cond:
+            self._count -= 1
+            if self._count == 0:
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._count == 0, timeout=timeout)
+
+
+inflight = InFlightTracker()
+
+
+def warmup():
+    # open the first pooled connection so the first request doesn't pay for it
+    for pool_engine in (engine, read_engine):
+        with pool_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    llm.get_http_session()
+    pages.preload()
+
+    if config.WARMUP_RECENT_CONVERSATIONS > 0:
+        db = Session()
+        try:
+            recent = (
+                db.query(Conversations.id)
+                .order_by(Conversations.updated_at.desc())
+                .limit(config.WARMUP_RECENT_CONVERSATIONS)
+                .subquery()
+            )
+            count = db.query(Queries).filter(Queries.conversation_id.in_(recent)).count()
+            logger.info("Warmed %d queries from recent conversations", count)
+        finally:
+            db.close()
+
+
+# uvicorn stops accepting connections and waits for open requests before the
+# lifespan shutdown runs, so by then nothing is left to drain. The drain starts
+# at the signal instead: SIGTERM marks the app draining (new /query calls get
+# 503 while the load balancer catches up), waits up to DRAIN_TIMEOUT for the
+# in-flight ones, then hands over to the server's own handler. A second signal
+# hands over at once.
+def install_drain_handler():
+    try:
+        previous = signal.getsignal(signal.SIGTERM)
+    except ValueError:
+        return None
+    if not callable(previous):
+        # no server handler to hand over to (run without uvicorn)
+        return None
+
+    def handle_sigterm(signum, frame):
+        if inflight.draining:
+            previous(signum, frame)
+            return
+        inflight.draining = True
+        logger.info("SIGTERM received, draining %d in-flight requests", inflight.count)
+
+        def wait_then_exit():
+            if not inflight.wait_idle(config.DRAIN_TIMEOUT):
+                logger.warning("Drain deadline reached with %d requests still running", inflight.count)
+            previous(signum, frame)
+
+        threading.Thread(target=wait_then_exit, name="drain", daemon=True).start()
+
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        # not on the main thread (e.g. under a test client)
+        return None
+    return previous
+
+
+def restore_signal_handler(previous):
+    if previous is not None:
+        try:
+            signal.signal(signal.SIGTERM, previous)
+        except ValueError:
+            pass
+
+
+async def drain():
+    inflight.draining = True
+    if inflight.count:
+        logger.info("Draining %d in-flight requests", inflight.count)
+    # normally already idle (see install_drain_handler); covers servers that
+    # run the lifespan shutdown without waiting for open requests
+    loop = asyncio.get_running_loop()
+    idle = await loop.run_in_executor(None, inflight.wait_idle, config.DRAIN_TIMEOUT)
+    if not idle:
+        logger.warning("Drain deadline reached with %d requests still running", inflight.count)
+
+    for hook in _shutdown_hooks:
+        try:
+            await loop.run_in_executor(None, hook)
+        except Exception as e:
+            logger.error("Shutdown hook %s failed: %s", hook.__name__, e)
+
+    tracing.flush()
+    llm.close_http_session()
+    engine.dispose()
+    read_engine.dispose()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    config.validate_config()
+    warmup()
+    maintenance.start()
+    previous_handler = install_drain_handler()
+    yield
+    restore_signal_handler(previous_handler)
+    await maintenance.stop()
+    await drain()
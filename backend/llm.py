@@ -0,0 +1,240 @@
+import hashlib
+import threading
+import time
+from typing import Optional
+
+import config
+import postprocess
+import tracing
+
+SITE_URL = config.FRONTEND_URL
+SITE_NAME = "AI Interact"
+DEFAULT_MODEL = "deepseek/deepseek-r1-zero:free"
+
+_http_session = None
+_http_lock = threading.Lock()
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    pass
+
+
+# Shared keep-alive connection pool for upstream calls. requests is imported
+# here rather than at module level to keep it off the startup path.
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        with _http_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE, pool_maxsize=config.HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def close_http_session():
+    global _http_session
+    with _http_lock:
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+
+
+# Backends
+
+class Backend:
+    name = None
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def complete(self, messages: list, model: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+
+# Any server speaking the OpenAI chat completions API (llama.cpp, vLLM, Ollama, ...)
+class OpenAICompatibleBackend(Backend):
+    def __init__(self, name: str, url: str, model: str, api_key: Optional[str] = None):
+        super().__init__(model)
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+
+    def headers(self) -> dict:
+        headers = {"Content-Type": "application/json", **tracing.propagation_headers()}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def complete(self, messages: list, model: Optional[str] = None) -> str:
+        response = get_http_session().post(
+            url=self.url,
+            headers=self.headers(),
+            json={
+                "model": model or self.model,
+                "messages": messages
+            },
+            timeout=config.LLM_TIMEOUT
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+class OpenRouterBackend(OpenAICompatibleBackend):
+    def __init__(self, url: str, api_key: str, model: str = DEFAULT_MODEL):
+        super().__init__("openrouter", url, model, api_key)
+
+    def headers(self) -> dict:
+        headers = super().headers()
+        headers["HTTP-Referer"] = SITE_URL
+        headers["X-Title"] = SITE_NAME
+        return headers
+
+
+# Deterministic stand-in for tests and load runs: same messages, same answer
+class FakeBackend(Backend):
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__("fake")
+        self.latency = latency
+
+    def complete(self, messages: list, model: Optional[str] = None) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        last = messages[-1]["content"] if messages else ""
+        digest = hashlib.sha1(repr(messages).encode("utf-8")).hexdigest()[:8]
+        return f"[fake:{digest}] {last}"
+
+
+# Rolling latency and error statistics used for routing
+class BackendStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.latency = None  # EWMA of successful call latency, seconds
+        self.error_rate = 0.0  # EWMA of failures
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float, ok: bool):
+        alpha = config.LLM_STATS_ALPHA
+        with self.lock:
+            self.requests += 1
+            self.error_rate = (1 - alpha) * self.error_rate + alpha * (0.0 if ok else 1.0)
+            if ok:
+                self.latency = latency if self.latency is None else (1 - alpha) * self.latency + alpha * latency
+                self.consecutive_errors = 0
+            else:
+                self.errors += 1
+                self.consecutive_errors += 1
+                if self.consecutive_errors >= config.LLM_FAILURE_THRESHOLD:
+                    self.cooldown_until = time.monotonic() + config.LLM_COOLDOWN
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    # expected seconds per successful answer; untried backends go first and
+    # ones that have only ever failed are treated as timing out
+    def score(self) -> float:
+        latency = self.latency
+        if latency is None:
+            latency = 0.0 if self.requests == 0 else config.LLM_TIMEOUT
+        return latency / max(1.0 - self.error_rate, 0.05)
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "healthy": self.healthy()
+        }
+
+
+_backends = {}
+_stats = {}
+
+
+def register(backend: Backend):
+    _backends[backend.name] = backend
+    _stats[backend.name] = BackendStats()
+
+
+def backend_names() -> list:
+    return list(_backends)
+
+
+def backend_stats() -> dict:
+    return {name: stats.snapshot() for name, stats in _stats.items()}
+
+
+# Use the requested backend while it is healthy, otherwise the healthy
+# routed backend with the best latency/error score
+def choose_backend(preferred: Optional[str] = None) -> Backend:
+    if preferred:
+        if preferred not in _backends:
+            raise LLMError(f"Unknown LLM backend: {preferred}")
+        if _stats[preferred].healthy():
+            return _backends[preferred]
+
+    candidates = [name for name in config.LLM_ROUTING if name in _backends] or list(_backends)
+    if not candidates:
+        raise LLMError("No LLM backend is configured")
+    healthy = [name for name in candidates if _stats[name].healthy()]
+    if healthy:
+        return _backends[min(healthy, key=lambda name: _stats[name].score())]
+    # everything is cooling down, try the one that recovers first
+    return _backends[min(candidates, key=lambda name: _stats[name].cooldown_until)]
+
+
+def _load_backends():
+    if config.OPENROUTER_API_URL:
+        register(OpenRouterBackend(config.OPENROUTER_API_URL, config.OPENROUTER_API_KEY))
+    if config.LOCAL_LLM_URL:
+        register(OpenAICompatibleBackend("local", config.LOCAL_LLM_URL, config.LOCAL_LLM_MODEL, config.LOCAL_LLM_API_KEY))
+    if config.FAKE_LLM:
+        register(FakeBackend(config.FAKE_LLM_LATENCY))
+
+
+_load_backends()
+
+
+# True when enough upstream calls are running that background work should back off
+def saturated() -> bool:
+    return _in_flight >= config.LLM_SATURATION
+
+
+# With clean=True the answer goes through the post-processing pipeline
+# configured for the model that produced it
+def complete(messages: list, model: Optional[str] = None, backend: Optional[str] = None, clean: bool = False) -> str:
+    global _in_flight
+    chosen = choose_backend(backend)
+    stats = _stats[chosen.name]
+
+    with _in_flight_lock:
+        _in_flight += 1
+    started = time.perf_counter()
+    try:
+        with tracing.span("llm.complete", kind=3, **{"llm.backend": chosen.name, "llm.model": model or chosen.model}):
+            content = chosen.complete(messages, model)
+    except Exception as e:
+        stats.record(time.perf_counter() - started, ok=False)
+        # connection errors, HTTP errors and unexpected response shapes alike
+        raise LLMError(f"{chosen.name}: {str(e)}") from e
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+
+    stats.record(time.perf_counter() - started, ok=True)
+    if clean:
+        content = postprocess.clean(content, model or chosen.model)
+    return content
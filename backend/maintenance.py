@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import config
+import metrics
+from models import Session, engine, RevokedToken, Conversations, ConversationTombstone, Queries, Users, UsageRollup
+from history import bump_history_version
+import archive
+
+logger = logging.getLogger(__name__)
+
+_task = None
+
+
+# Delete matching rows a small batch at a time so no write lock is held for long
+def delete_in_batches(session, model, condition) -> int:
+    total = 0
+    while True:
+        ids = [row[0] for row in session.query(model.id).filter(condition).limit(config.GC_BATCH_SIZE).all()]
+        if not ids:
+            break
+        session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        session.commit()
+        total += len(ids)
+        if len(ids) < config.GC_BATCH_SIZE:
+            break
+        time.sleep(config.GC_BATCH_PAUSE)
+    return total
+
+
+def purge_expired_revocations(session) -> int:
+    # a revoked token is useless once it has expired on its own, and every
+    # token in a bucket below the current one has
+    current_bucket = int(time.time()) // config.REVOCATION_BUCKET_SECONDS
+    return delete_in_batches(session, RevokedToken, RevokedToken.bucket < current_bucket)
+
+
+def prune_empty_conversations(session) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=config.EMPTY_CONVERSATION_GRACE)
+    has_queries = session.query(Queries.id).filter(Queries.conversation_id == Conversations.id).exists()
+    is_active = session.query(Users.id).filter(Users.active_conversation_id == Conversations.id).exists()
+    # archived conversations have no hot queries but are not empty
+    condition = (Conversations.created_at < cutoff) & Conversations.archive_month.is_(None) & ~has_queries & ~is_active
+
+    candidates = dict(session.query(Conversations.id, Conversations.user_id).filter(condition).all())
+    if not candidates:
+        return 0
+    deleted = delete_in_batches(session, Conversations, Conversations.id.in_(candidates) & condition)
+    if deleted:
+        remaining = {row[0] for row in session.query(Conversations.id).filter(Conversations.id.in_(candidates))}
+        bump_history_version(session, [], deleted=[(cid, uid) for cid, uid in candidates.items() if cid not in remaining])
+        session.commit()
+    return deleted
+
+
+def purge_tombstones(session) -> int:
+    # clients that last synced before this have to fetch the full history
+    cutoff = datetime.utcnow() - timedelta(seconds=config.HISTORY_TOMBSTONE_RETENTION)
+    return delete_in_batches(session, ConversationTombstone, ConversationTombstone.deleted_at < cutoff)
+
+
+def purge_usage_rollups(session) -> int:
+    # minute and hour rows only feed short reporting windows; day rows are kept
+    now = datetime.utcnow()
+    deleted = 0
+    for granularity, retention in (("minute", config.USAGE_MINUTE_RETENTION), ("hour", config.USAGE_HOUR_RETENTION)):
+        cutoff = now - timedelta(seconds=retention)
+        deleted += delete_in_batches(
+            session, UsageRollup,
+            (UsageRollup.granularity == granularity) & (UsageRollup.bucket_start < cutoff)
+        )
+    return deleted
+
+
+def vacuum_sqlite() -> int:
+    if engine.dialect.name != "sqlite":
+        return 0
+
+    with engine.connect() as conn:
+        page_size = conn.execute(text("PRAGMA page_size")).scalar()
+        free_before = conn.execute(text("PRAGMA freelist_count")).scalar()
+        # only frees pages once the file is in auto_vacuum=INCREMENTAL mode (set by
+        # migration 5d1c9a7e2f40), and then a bounded number per run. The pragma
+        # frees one page per step and sqlite3's execute() steps it once, so it
+        # goes through executescript(), which runs it to completion.
+        if conn.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+            conn.commit()
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({config.GC_VACUUM_PAGES});")
+        # re-analyzes only the tables whose statistics are stale
+        conn.execute(text("PRAGMA optimize"))
+        free_after = conn.execute(text("PRAGMA freelist_count")).scalar()
+        conn.commit()
+
+    return max(free_before - free_after, 0) * page_size
+
+
+def run_maintenance() -> dict:
+    started = time.perf_counter()
+    session = Session()
+    try:
+        report = {
+            "revoked_tokens_deleted": purge_expired_revocations(session),
+            "empty_conversations_deleted": prune_empty_conversations(session),
+            "tombstones_deleted": purge_tombstones(session),
+            "usage_rollups_deleted": purge_usage_rollups(session),
+            "conversations_archived": archive.archive_cold_conversations(session),
+        }
+    finally:
+        session.close()
+    report["bytes_reclaimed"] = vacuum_sqlite()
+
+    for name, value in report.items():
+        metrics.incr(f"maintenance.{name}", value)
+    metrics.incr("maintenance.runs")
+    metrics.set_gauge("maintenance.last_run_seconds", round(time.perf_counter() - started, 3))
+    metrics.set_gauge("maintenance.last_run_at", datetime.utcnow().isoformat())
+    return report
+
+
+async def _loop():
+    while True:
+        await asyncio.sleep(config.GC_INTERVAL)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, run_maintenance)
+        except Exception as e:
+            metrics.incr("maintenance.errors")
+            logger.error("Maintenance run failed: %s", e)
+
+
+def start():
+    global _task
+    if config.GC_INTERVAL > 0 and _task is None:
+        _task = asyncio.get_running_loop().create_task(_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,29 @@
+"""conversation archive month
+
+Revision ID: 0b8e4f7a3c21
+Revises: f3a7d2c85b19
+Create Date: 2026-10-19 17:21:09.448173
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b8e4f7a3c21'
+down_revision: Union[str, None] = 'f3a7d2c85b19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('archive_month', sa.String(length=7), nullable=True))
+
+
+def downgrade() -> None:
+    # Rehydrate archived conversations (or disable ARCHIVE_AFTER_DAYS and
+    # continue each one) before downgrading, or their queries stay in the archive files.
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('archive_month')
@@ -0,0 +1,39 @@
+"""sqlite incremental vacuum
+
+Revision ID: 5d1c9a7e2f40
+Revises: 0b8e4f7a3c21
+Create Date: 2026-10-19 18:05:37.201944
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1c9a7e2f40'
+down_revision: Union[str, None] = '0b8e4f7a3c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# maintenance.vacuum_sqlite runs PRAGMA incremental_vacuum, which is a no-op
+# unless the file is in auto_vacuum=INCREMENTAL mode. Switching an existing
+# file needs one full VACUUM, which cannot run inside a transaction and
+# rewrites the whole database, so run it during a deploy window.
+def _set_auto_vacuum(mode: str) -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    with op.get_context().autocommit_block():
+        bind.exec_driver_sql(f"PRAGMA auto_vacuum={mode}")
+        bind.exec_driver_sql("VACUUM")
+
+
+def upgrade() -> None:
+    _set_auto_vacuum("INCREMENTAL")
+
+
+def downgrade() -> None:
+    _set_auto_vacuum("NONE")
@@ -0,0 +1,43 @@
+"""history deltas
+
+Revision ID: 8a3f6d0b5e92
+Revises: 5d1c9a7e2f40
+Create Date: 2026-10-19 18:42:13.906514
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a3f6d0b5e92'
+down_revision: Union[str, None] = '5d1c9a7e2f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('conversation_tombstones',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_conversation_tombstones_user_version', 'conversation_tombstones', ['user_id', 'version'], unique=False)
+    # existing conversations count as changed at version 0, so the first
+    # ?since_version=0 delta returns all of them
+    op.add_column('conversations', sa.Column('changed_version', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_conversations_user_changed_version', 'conversations', ['user_id', 'changed_version'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversations_user_changed_version', table_name='conversations')
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('changed_version')
+    op.drop_index('ix_conversation_tombstones_user_version', table_name='conversation_tombstones')
+    op.drop_table('conversation_tombstones')
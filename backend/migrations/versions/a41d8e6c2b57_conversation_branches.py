@@ -0,0 +1,49 @@
+"""conversation branches
+
+Revision ID: a41d8e6c2b57
+Revises: 7c3e5a1f9b20
+Create Date: 2026-10-19 13:02:17.904118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41d8e6c2b57'
+down_revision: Union[str, None] = '7c3e5a1f9b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('queries') as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_queries_parent_id_queries', 'queries', ['parent_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_queries_parent_id'), ['parent_id'], unique=False)
+    op.add_column('conversations', sa.Column('head_query_id', sa.Integer(), nullable=True))
+
+    # Existing conversations become a single branch in insertion order
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, conversation_id FROM queries "
+        "WHERE conversation_id IS NOT NULL ORDER BY conversation_id, create_at, id"
+    )).fetchall()
+    heads = {}
+    for query_id, conversation_id in rows:
+        parent_id = heads.get(conversation_id)
+        if parent_id is not None:
+            conn.execute(sa.text("UPDATE queries SET parent_id = :p WHERE id = :id"), {"p": parent_id, "id": query_id})
+        heads[conversation_id] = query_id
+    for conversation_id, head_id in heads.items():
+        conn.execute(sa.text("UPDATE conversations SET head_query_id = :h WHERE id = :id"), {"h": head_id, "id": conversation_id})
+
+
+def downgrade() -> None:
+    op.drop_column('conversations', 'head_query_id')
+    with op.batch_alter_table('queries') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_queries_parent_id'))
+        batch_op.drop_constraint('fk_queries_parent_id_queries', type_='foreignkey')
+        batch_op.drop_column('parent_id')
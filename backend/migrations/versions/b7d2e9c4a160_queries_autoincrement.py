@@ -0,0 +1,55 @@
+"""queries autoincrement
+
+Revision ID: b7d2e9c4a160
+Revises: 8a3f6d0b5e92
+Create Date: 2026-10-19 20:12:48.517320
+
+"""
+import glob
+import os
+import sqlite3
+from contextlib import closing
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from config import ARCHIVE_DIR
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e9c4a160'
+down_revision: Union[str, None] = '8a3f6d0b5e92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Archived queries leave the hot table and come back under their own ids, so
+# SQLite must never hand those ids out again: queries becomes an AUTOINCREMENT
+# table (a rebuild), and its sequence starts above every id already archived.
+# Postgres sequences never reuse ids.
+def _archived_max_id() -> int:
+    highest = 0
+    for path in glob.glob(os.path.join(ARCHIVE_DIR, "conversations-*.db")):
+        with closing(sqlite3.connect(path)) as conn:
+            highest = max(highest, conn.execute("SELECT coalesce(max(id), 0) FROM query_ids").fetchone()[0])
+    return highest
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('queries', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+        pass
+
+    highest = max(bind.execute(sa.text("SELECT coalesce(max(id), 0) FROM queries")).scalar(), _archived_max_id())
+    bind.execute(sa.text("DELETE FROM sqlite_sequence WHERE name = 'queries'"))
+    bind.execute(sa.text("INSERT INTO sqlite_sequence (name, seq) VALUES ('queries', :seq)"), {"seq": highest})
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('queries', recreate='always'):
+        pass
@@ -0,0 +1,43 @@
+"""conversations autoincrement
+
+Revision ID: c4e8a2f61d93
+Revises: b7d2e9c4a160
+Create Date: 2026-10-19 20:41:06.183952
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a2f61d93'
+down_revision: Union[str, None] = 'b7d2e9c4a160'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# History deltas report deleted conversations by id, so SQLite must not hand a
+# deleted id to a new conversation: conversations becomes an AUTOINCREMENT
+# table (a rebuild), its sequence starting above every tombstoned id.
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('conversations', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+        pass
+
+    highest = bind.execute(sa.text(
+        "SELECT max((SELECT coalesce(max(id), 0) FROM conversations),"
+        " (SELECT coalesce(max(conversation_id), 0) FROM conversation_tombstones))"
+    )).scalar()
+    bind.execute(sa.text("DELETE FROM sqlite_sequence WHERE name = 'conversations'"))
+    bind.execute(sa.text("INSERT INTO sqlite_sequence (name, seq) VALUES ('conversations', :seq)"), {"seq": highest})
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('conversations', recreate='always'):
+        pass
@@ -0,0 +1,88 @@
+"""token accounting
+
+Revision ID: c9f27b4d1e83
+Revises: a41d8e6c2b57
+Create Date: 2026-10-19 13:41:55.220917
+
+"""
+from typing import Sequence, Union
+
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9f27b4d1e83'
+down_revision: Union[str, None] = 'a41d8e6c2b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Frozen copy of tokens.py as of this revision, so later changes to the
+# heuristic don't change what this backfill produces
+PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+")
+WORD_CHUNK = 7
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    total = 0
+    for piece in PIECE_RE.findall(text):
+        stripped = piece.lstrip(" ")
+        if stripped and stripped[0].isalpha():
+            total += 1 + (len(stripped) - 1) // WORD_CHUNK
+        else:
+            total += 1
+    return total
+
+
+def turn_tokens(query_tokens: int, response_tokens: int) -> int:
+    return query_tokens + response_tokens + 2 * MESSAGE_OVERHEAD
+
+
+def upgrade() -> None:
+    op.add_column('queries', sa.Column('query_tokens', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('queries', sa.Column('response_tokens', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('queries', sa.Column('context_tokens', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('conversations', sa.Column('token_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('token_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Count existing rows once; parents always have lower ids than their children
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, parent_id, user_id, conversation_id, query_text, response_text FROM queries ORDER BY id"
+    )).fetchall()
+    context = {}
+    per_conversation = {}
+    per_user = {}
+    for query_id, parent_id, user_id, conversation_id, query_text, response_text in rows:
+        query_tokens = count_tokens(query_text)
+        response_tokens = count_tokens(response_text)
+        tokens = turn_tokens(query_tokens, response_tokens)
+        context[query_id] = context.get(parent_id, 0) + tokens
+        per_conversation[conversation_id] = per_conversation.get(conversation_id, 0) + tokens
+        per_user[user_id] = per_user.get(user_id, 0) + tokens
+        conn.execute(
+            sa.text("UPDATE queries SET query_tokens = :q, response_tokens = :r, context_tokens = :c WHERE id = :id"),
+            {"q": query_tokens, "r": response_tokens, "c": context[query_id], "id": query_id}
+        )
+    for conversation_id, tokens in per_conversation.items():
+        if conversation_id is not None:
+            conn.execute(sa.text("UPDATE conversations SET token_count = :t WHERE id = :id"), {"t": tokens, "id": conversation_id})
+    for user_id, tokens in per_user.items():
+        conn.execute(sa.text("UPDATE users SET token_count = :t WHERE id = :id"), {"t": tokens, "id": user_id})
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('token_count')
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('token_count')
+    with op.batch_alter_table('queries') as batch_op:
+        batch_op.drop_column('context_tokens')
+        batch_op.drop_column('response_tokens')
+        batch_op.drop_column('query_tokens')
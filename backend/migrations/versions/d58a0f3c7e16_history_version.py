@@ -0,0 +1,29 @@
+"""history version
+
+Revision ID: d58a0f3c7e16
+Revises: c9f27b4d1e83
+Create Date: 2026-10-19 14:10:32.618402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd58a0f3c7e16'
+down_revision: Union[str, None] = 'c9f27b4d1e83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('history_version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('history_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('history_updated_at')
+        batch_op.drop_column('history_version')
@@ -0,0 +1,27 @@
+"""user llm backend
+
+Revision ID: e2b6c91a4d08
+Revises: d58a0f3c7e16
+Create Date: 2026-10-19 14:47:03.127559
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b6c91a4d08'
+down_revision: Union[str, None] = 'd58a0f3c7e16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('llm_backend', sa.String(length=50), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('llm_backend')
@@ -0,0 +1,44 @@
+"""usage rollups
+
+Revision ID: f3a7d2c85b19
+Revises: e2b6c91a4d08
+Create Date: 2026-10-19 16:02:48.630215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a7d2c85b19'
+down_revision: Union[str, None] = 'e2b6c91a4d08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The ledger starts empty: past queries stored no upstream latency, and
+    # the quotas only look at the current minute and day.
+    op.create_table('usage_rollups',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=8), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('requests', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('errors', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('prompt_tokens', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('completion_tokens', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('latency_ms', sa.BigInteger(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_usage_rollups_bucket', 'usage_rollups', ['granularity', 'bucket_start'], unique=False)
+    op.create_index('ix_usage_rollups_user_bucket', 'usage_rollups', ['user_id', 'granularity', 'bucket_start'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_usage_rollups_user_bucket', table_name='usage_rollups')
+    op.drop_index('ix_usage_rollups_bucket', table_name='usage_rollups')
+    op.drop_table('usage_rollups')
@@ -1,5 +1,5 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, VARCHAR
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, VARCHAR, Index
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 from sqlalchemy import create_engine
@@ -7,11 +7,41 @@ from sqlalchemy import create_engine
 from sqlalchemy.sql import func
 from sqlalchemy import DateTime
 
-# connect to  database
-engine = create_engine('sqlite:///app.db', echo=True)
+from sqlalchemy import event
+from config import SQL_ECHO, DATABASE_URL, DATABASE_READ_URL, SQLITE_WAL
+import tracing
+
+# connect to  database (create_engine opens no connection; the lifespan
+# warmup opens the first one)
+engine = create_engine(DATABASE_URL, echo=SQL_ECHO)
+tracing.instrument_engine(engine)
+
+# separate pool for read-only handlers, so heavy history reads never queue
+# behind (or hold up) the connections doing writes
+read_engine = create_engine(DATABASE_READ_URL, echo=SQL_ECHO)
+tracing.instrument_engine(read_engine)
+
+
+# WAL lets SQLite readers keep reading while a write is in progress
+if engine.dialect.name == "sqlite" and SQLITE_WAL:
+    @event.listens_for(engine, "connect")
+    def _sqlite_wal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+if read_engine.dialect.name == "sqlite":
+    @event.listens_for(read_engine, "connect")
+    def _sqlite_read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
 
 # create a session
 Session = sessionmaker(bind=engine)
+ReadSession = sessionmaker(bind=read_engine)
 
 # create an instance of the session
 def get_db():
@@ -21,6 +51,14 @@ def get_db():
     finally:
         db.close()
 
+# read-only session for reporting reads that need no read-your-writes
+def get_read_db():
+    db = ReadSession()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # base class for models
 Base = declarative_base()
 
@@ -33,9 +71,13 @@ class Users(Base):
     name = Column(String(255), nullable=False, unique=True)
     email = Column(VARCHAR(255), nullable=False, unique=True)
     password = Column(VARCHAR(255), nullable=False)
-    create_at = Column(DateTime(), default=datetime.now())
+    create_at = Column(DateTime(), default=datetime.now)
 
     active_conversation_id = Column(Integer, ForeignKey('conversations.id'), nullable=True)
+    token_count = Column(Integer, nullable=False, default=0, server_default='0')
+    history_version = Column(Integer, nullable=False, default=0, server_default='0')  # bumped by every history write
+    history_updated_at = Column(DateTime(), nullable=True)
+    llm_backend = Column(String(50), nullable=True)  # preferred backend, routed when unset
 
 
     queries = relationship('Queries', backref='users', cascade='all, delete-orphan')
@@ -48,10 +90,17 @@ class Queries(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     conversation_id = Column(Integer, ForeignKey('conversations.id'), nullable=True)
+    parent_id = Column(Integer, ForeignKey('queries.id'), nullable=True, index=True)  # previous turn on this branch
     query_text = Column(Text, nullable=False)
     response_text = Column(Text, nullable=False)
-    create_at = Column(DateTime(), default=datetime.now())
-    updated_at = Column(DateTime(), default=datetime.now(), onupdate=datetime.now())
+    query_tokens = Column(Integer, nullable=False, default=0, server_default='0')
+    response_tokens = Column(Integer, nullable=False, default=0, server_default='0')
+    context_tokens = Column(Integer, nullable=False, default=0, server_default='0')  # whole branch up to and including this turn
+    create_at = Column(DateTime(), default=datetime.now)
+    updated_at = Column(DateTime(), default=datetime.now, onupdate=datetime.now)
+
+    # ids are never reused: archived queries come back under their own ids
+    __table_args__ = {"sqlite_autoincrement": True}
 
 
 # Conversations Table
@@ -61,15 +110,67 @@ class Conversations(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     title = Column(String(255), nullable=True)
+    head_query_id = Column(Integer, nullable=True)  # latest turn of the branch being continued
+    token_count = Column(Integer, nullable=False, default=0, server_default='0')
+    archive_month = Column(String(7), nullable=True)  # YYYY-MM archive file holding its queries, None while hot
+    changed_version = Column(Integer, nullable=False, default=0, server_default='0')  # owner's history_version at its last change
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
     queries = relationship('Queries', backref='conversation', cascade='all, delete-orphan')
 
+    # ids are never reused: history deltas report deleted ones
+    __table_args__ = (
+        Index('ix_conversations_user_changed_version', 'user_id', 'changed_version'),
+        {"sqlite_autoincrement": True},
+    )
+
+
+# Deleted conversations, so history deltas can tell clients to drop them
+class ConversationTombstone(Base):
+    __tablename__ = "conversation_tombstones"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    conversation_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)  # owner's history_version after the delete
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_conversation_tombstones_user_version', 'user_id', 'version'),
+    )
+
 
 # Revoked Token Table
 class RevokedToken(Base):
     __tablename__ = "revoked_tokens"
 
     id = Column(Integer, primary_key=True, index=True)
-    token = Column(String, unique=True, index=True, nullable=False)
+    jti = Column(String(16), nullable=False)
+    bucket = Column(Integer, nullable=False)  # exp // REVOCATION_BUCKET_SECONDS
+    expires_at = Column(DateTime, nullable=False)
     revoked_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_revoked_tokens_bucket_jti', 'bucket', 'jti', unique=True),
+    )
+
+
+# Usage ledger: one row per user, granularity (minute, hour, day) and bucket,
+# incremented in place on every upstream call
+class UsageRollup(Base):
+    __tablename__ = "usage_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    granularity = Column(String(8), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)  # UTC, truncated to the granularity
+    requests = Column(Integer, nullable=False, default=0, server_default='0')
+    errors = Column(Integer, nullable=False, default=0, server_default='0')
+    prompt_tokens = Column(BigInteger, nullable=False, default=0, server_default='0')
+    completion_tokens = Column(BigInteger, nullable=False, default=0, server_default='0')
+    latency_ms = Column(BigInteger, nullable=False, default=0, server_default='0')  # summed upstream latency
+
+    __table_args__ = (
+        Index('ix_usage_rollups_user_bucket', 'user_id', 'granularity', 'bucket_start', unique=True),
+        Index('ix_usage_rollups_bucket', 'granularity', 'bucket_start'),
+    )
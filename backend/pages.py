@@ -0,0 +1,33 @@
+import hashlib
+import os
+
+from fastapi import Request
+from fastapi.responses import Response
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+_pages = {}
+
+
+# Static pages are read once and kept as bytes with a content hash ETag
+def get_page(name: str):
+    page = _pages.get(name)
+    if page is None:
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            body = f.read()
+        page = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+        _pages[name] = page
+    return page
+
+
+def page_response(request: Request, name: str, media_type: str = "text/html; charset=utf-8") -> Response:
+    body, etag = get_page(name)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def preload():
+    for name in os.listdir(STATIC_DIR):
+        get_page(name)
@@ -0,0 +1,298 @@
+import re
+from functools import lru_cache
+
+import config
+
+# Response post-processing. Enabled transforms share one scan: a single
+# character-class regex (which the re engine can search for quickly) finds
+# the few positions where any transform could apply, and one anchored regex
+# with a group per token decides what is there. The same code handles whole
+# responses and streamed chunks: state (inside <think>, \boxed{} brace depth)
+# carries across chunks and only the trailing partial word and whitespace run
+# are held back, so feeding any split of a response gives the same text as
+# processing it whole.
+#
+# "think" drops <think>...</think> blocks; a response cut off inside one keeps
+# the reasoning rather than coming back empty. "think_lead" is for models whose
+# template opens the block in the prompt (enable it per model through
+# POSTPROCESS_MODELS): everything before a </think> with no opening tag, within
+# the first THINK_LEAD characters, is dropped, and streaming holds that lead
+# back until it knows. "markdown" leaves fenced code blocks and two-space hard
+# line breaks as they are.
+
+TRANSFORMS = {
+    # name: (trigger characters, [(group, pattern), ...])
+    "think": ("<", [
+        ("think_open", r"<think>"),
+    ]),
+    "think_lead": ("<", [
+        ("think_close", r"</think>"),
+    ]),
+    "boxed": ("\\\\{}", [
+        ("box_open", r"\\boxed\{"),
+        ("brace_open", r"\{"),
+        ("brace_close", r"\}"),
+    ]),
+    "pii": ("@+(0-9", [
+        ("email", r"@[A-Za-z0-9\-]+(?:\.[A-Za-z0-9\-]+)*\.[A-Za-z]{2,}"),
+        ("phone", r"(?:\+\d{1,3}[\-.])?\(?\d{3}\)?[\-.]\d{3}[\-.]\d{4}(?![\w.])"),
+    ]),
+    "markdown": ("\r\n", [
+        ("newlines", r"\r?\n(?:[ \t]*\r?\n)*"),
+    ]),
+}
+TRANSFORM_ORDER = ("think", "think_lead", "boxed", "pii", "markdown")
+
+THINK_CLOSE = "</think>"
+EMAIL_LOCAL_RE = re.compile(r"[A-Za-z0-9._%+\-]+\Z")
+WORD_CHAR_RE = re.compile(r"[\w.]")
+FENCE_RE = re.compile(r"[ ]{0,3}(?:```|~~~)")
+
+MAX_HOLD = 1024  # longest tail kept back while streaming
+FORCE_KEEP = 64  # when forced to flush, still keep this much for a split token
+THINK_LEAD = 32768  # a lone </think> further in than this is only removed itself
+
+
+class Pipeline:
+    def __init__(self, transforms):
+        self.transforms = tuple(name for name in TRANSFORM_ORDER if name in transforms)
+        triggers = "".join(TRANSFORMS[name][0] for name in self.transforms)
+        alternatives = [
+            f"(?P<{group}>{pattern})"
+            for name in self.transforms
+            for group, pattern in TRANSFORMS[name][1]
+        ]
+        self.trigger = re.compile(f"[{triggers}]") if triggers else None
+        self.token = re.compile("|".join(alternatives)) if alternatives else None
+
+    def process(self, text: str) -> str:
+        return StreamProcessor(self).run(text)
+
+    def stream(self) -> "StreamProcessor":
+        return StreamProcessor(self)
+
+
+class StreamProcessor:
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.buffer = ""
+        self.in_think = False
+        self.think_text = ""  # inside an unclosed <think>, in case it never closes
+        self.leading = "think_lead" in pipeline.transforms  # a lone </think> may still come
+        self.lead = ""  # output held back while leading
+        self.offset = 0  # characters scanned so far
+        self.box_depths = []  # brace depth of each open \boxed{
+        self.depth = 0
+        self.in_fence = False  # inside a fenced code block
+        self.started = False
+        self.space = ""  # trailing whitespace held until more text follows
+
+    def run(self, text: str) -> str:
+        self.buffer += text
+        return self.finish()
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        cut = _safe_cut(self.buffer)
+        if cut == 0 and len(self.buffer) > MAX_HOLD:
+            cut = len(self.buffer) - FORCE_KEEP
+        ready, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self._emit(self._step(ready, final=False), final=False)
+
+    def finish(self) -> str:
+        ready, self.buffer = self.buffer, ""
+        out = self._step(ready, final=True)
+        while self.in_think:
+            # cut off inside <think>: keep the reasoning, minus the tag
+            self.in_think = False
+            held, self.think_text = self.think_text, ""
+            out += self._step(held, final=True)
+        return self._emit(out, final=True)
+
+    def _step(self, text: str, final: bool) -> str:
+        out = self._scan(text)
+        self.offset += len(text)
+        if self.leading and (final or self.offset >= THINK_LEAD):
+            self.leading = False
+        if self.leading:
+            self.lead += out
+            return ""
+        out, self.lead = self.lead + out, ""
+        return out
+
+    def _emit(self, out: str, final: bool) -> str:
+        out, self.space = self.space + out, ""
+        if not self.started:
+            out = out.lstrip()
+            self.started = bool(out)
+        if final:
+            return out.rstrip()
+        kept = out.rstrip()
+        self.space = out[len(kept):]
+        return kept
+
+    def _scan(self, text: str) -> str:
+        trigger, token = self.pipeline.trigger, self.pipeline.token
+        out = []
+        pos = 0  # start of text not yet emitted
+        i = 0  # where to look for the next trigger
+        end = len(text)
+        if self.offset == 0 and token is not None and "newlines" in token.groupindex and FENCE_RE.match(text):
+            self.in_fence = True
+
+        while i < end:
+            if self.in_think:
+                close = text.find(THINK_CLOSE, i)
+                if close < 0:
+                    self.think_text += text[i:]
+                    return "".join(out)
+                self.in_think = False
+                self.think_text = ""
+                pos = i = close + len(THINK_CLOSE)
+                continue
+
+            found = trigger.search(text, i) if trigger is not None else None
+            if found is None:
+                break
+            i = found.start()
+            if text[i] == "\n" and text[i - 1:i] not in (" ", "\t") and text[i + 1:i + 2] not in (" ", "\t", "\r", "\n", "`", "~"):
+                # a plain line break, nothing to change
+                i += 1
+                continue
+            match = token.match(text, i)
+            if match is None:
+                i += 1
+                continue
+
+            kind = match.lastgroup
+            if kind == "phone" and i > 0 and WORD_CHAR_RE.match(text, i - 1):
+                i += 1
+                continue
+
+            segment = text[pos:i]
+            if kind == "think_close":
+                if self.leading and self.offset + i < THINK_LEAD:
+                    # the reasoning started in the prompt: drop all of it
+                    out.clear()
+                    self.lead = ""
+                    self.box_depths.clear()
+                    self.depth = 0
+                    self.in_fence = False
+                else:
+                    out.append(segment)
+                self.leading = False
+            elif kind == "email":
+                local = EMAIL_LOCAL_RE.search(segment)
+                if local is None:
+                    i += 1
+                    continue
+                out.append(segment[:local.start()])
+                out.append("[email]")
+            elif kind == "newlines":
+                single = match.group().count("\n") == 1
+                if self.in_fence:
+                    out.append(segment)
+                    out.append(match.group())
+                elif single and segment.endswith("  "):
+                    # two trailing spaces are a hard line break
+                    out.append(segment.rstrip(" \t") + "  \n")
+                else:
+                    # other trailing spaces go, runs of blank lines become one
+                    out.append(segment.rstrip(" \t"))
+                    out.append("\n" if single else "\n\n")
+                if FENCE_RE.match(text, match.end()):
+                    self.in_fence = not self.in_fence
+            else:
+                out.append(segment)
+                if kind == "think_open":
+                    self.in_think = True
+                    self.leading = False
+                elif kind == "box_open":
+                    self.depth += 1
+                    self.box_depths.append(self.depth)
+                elif kind == "brace_open":
+                    self.depth += 1
+                    out.append("{")
+                elif kind == "brace_close":
+                    if self.box_depths and self.box_depths[-1] == self.depth:
+                        self.box_depths.pop()
+                    else:
+                        out.append("}")
+                    self.depth = max(self.depth - 1, 0)
+                elif kind == "phone":
+                    out.append("[phone]")
+            pos = i = match.end()
+
+        if not self.in_think:
+            out.append(text[pos:])
+        return "".join(out)
+
+
+# Everything up to the last complete word; the partial word and the whitespace
+# before it stay buffered so no token is split between chunks
+def _safe_cut(buffer: str) -> int:
+    i = len(buffer)
+    while i > 0 and not buffer[i - 1].isspace():
+        i -= 1
+    while i > 0 and buffer[i - 1].isspace():
+        i -= 1
+    return i
+
+
+def _parse_model_transforms(spec: str) -> dict:
+    # "model-a=think,boxed;model-b=think,pii"
+    mapping = {}
+    for entry in spec.split(";"):
+        if "=" in entry:
+            model, names = entry.split("=", 1)
+            mapping[model.strip()] = frozenset(n.strip() for n in names.split(",") if n.strip())
+    return mapping
+
+
+DEFAULT_TRANSFORMS = frozenset(n.strip() for n in config.POSTPROCESS_DEFAULT.split(",") if n.strip())
+MODEL_TRANSFORMS = _parse_model_transforms(config.POSTPROCESS_MODELS)
+
+
+@lru_cache(maxsize=None)
+def _pipeline(transforms: frozenset) -> Pipeline:
+    return Pipeline(transforms)
+
+
+def pipeline_for(model: str = None) -> Pipeline:
+    return _pipeline(MODEL_TRANSFORMS.get(model, DEFAULT_TRANSFORMS))
+
+
+def clean(text: str, model: str = None) -> str:
+    return pipeline_for(model).process(text)
+
+
+if __name__ == "__main__":
+    # Microbenchmark: python postprocess.py
+    import timeit
+
+    paragraph = (
+        "Here is the answer for \\boxed{x^{2} + \\frac{1}{2}} with details.   \n"
+        "Contact support@example.com or 555-123-4567 for help.\n\n\n\n"
+        "Markdown **bold** and `code {braces}` stay as they are.\r\n"
+    )
+    sample = "<think>" + "reasoning step " * 200 + "</think>\n" + paragraph * 40
+    pipeline = Pipeline(TRANSFORM_ORDER)
+    old_boxed = re.compile(r"\\boxed\{([^}]*)\}")
+
+    def streamed():
+        processor = pipeline.stream()
+        parts = [processor.feed(sample[i:i + 64]) for i in range(0, len(sample), 64)]
+        parts.append(processor.finish())
+        return "".join(parts)
+
+    assert streamed() == pipeline.process(sample)
+
+    runs = 200
+    size_kb = len(sample) / 1024
+    for label, fn in (
+        ("old single regex", lambda: old_boxed.sub(r"\1", sample).strip()),
+        ("pipeline, whole text", lambda: pipeline.process(sample)),
+        ("pipeline, 64-char chunks", streamed),
+    ):
+        seconds = timeit.timeit(fn, number=runs) / runs
+        print(f"{label:26s} {seconds * 1e6:9.1f} us per {size_kb:.1f} KB  ({size_kb / 1024 / seconds:.1f} MB/s)")
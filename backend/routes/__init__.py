@@ -1,2 +0,0 @@
-from .user import *
-from .query import *
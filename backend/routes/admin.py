@@ -0,0 +1,28 @@
+from typing import Literal
+from fastapi import Depends, APIRouter, Query
+from sqlalchemy.orm import Session
+
+from models import get_read_db, Users
+from auth import get_admin_user
+import usage
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"]
+)
+
+
+# Top consumers of upstream capacity, aggregated from the usage rollups
+@router.get("/usage/top")
+def top_consumers(
+    period: Literal["hour", "day", "week", "month"] = "day",
+    order_by: Literal["tokens", "requests", "latency"] = "tokens",
+    limit: int = Query(10, ge=1, le=100),
+    session: Session = Depends(get_read_db),
+    admin: Users = Depends(get_admin_user)
+):
+    return {
+        "period": period,
+        "order_by": order_by,
+        "users": usage.top_consumers(session, period, limit, order_by)
+    }
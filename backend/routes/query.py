@@ -1,106 +1,467 @@
-import os
-import re
-import requests
-from dotenv import load_dotenv
-from fastapi import Depends, HTTPException, APIRouter
+import json
+import logging
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from fastapi import Depends, HTTPException, APIRouter, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from sqlalchemy import insert, update, or_, and_
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from models import get_db, Users, Queries, Conversations
-from schemas import CreateQuerySchema, ConversationOutSchema
+from models import get_db, Users, Queries, Conversations, ConversationTombstone, Session as SessionLocal
+from schemas import CreateQuerySchema, BatchQuerySchema, ForkQuerySchema, RegenerateQuerySchema, ConversationHeadSchema, ConversationOutSchema
 from auth import get_current_user
-from config import FRONTEND_URL
-
-load_dotenv()
+from config import BATCH_MAX_ITEMS, BATCH_CONCURRENCY, BATCH_INSERT_SIZE, MAX_CONTEXT_TOKENS
+from lifespan import inflight
+from branches import ancestor_path, path_messages
+from tokens import count_tokens, turn_tokens, trim_to_budget, MESSAGE_OVERHEAD
+from history import bump_history_version, serving_user, cache_headers, is_not_modified, get_history_db
+import llm
+import archive
+import titles
+import usage
+import tracing
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/query",
     tags=["LLM"]
 )
 
-# Environment variables
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL")
-SITE_URL = FRONTEND_URL
-SITE_NAME = "AI Interact"
+def get_or_create_conversation(session: Session, current_user: Users, conversation_id: Optional[int]) -> Conversations:
+    conversation_id = conversation_id or current_user.active_conversation_id
 
+    if conversation_id:
+        convo = session.query(Conversations).filter_by(id=conversation_id, user_id=current_user.id).first()
+        if not convo:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        archive.rehydrate(session, [convo])
+        return convo
 
-def clean_response_text(text: str) -> str:
-    return re.sub(r"\\boxed\{([^}]*)\}", r"\1", text).strip()
+    new_convo = Conversations(
+        user_id=current_user.id,
+        title="New Conversation"
+    )
+    session.add(new_convo)
+    session.commit()
+    session.refresh(new_convo)
 
+    current_user.active_conversation_id = new_convo.id
+    bump_history_version(session, [current_user.id], [new_convo.id])
+    session.commit()
 
-@router.post("/")
-def ask_query(
-    data: CreateQuerySchema,
-    session: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
-):
-    try:
-        conversation_id = data.conversation_id or current_user.active_conversation_id
-
-        if not conversation_id:
-            new_convo = Conversations(
-                user_id=current_user.id,
-                title="New Conversation"
-            )
-            session.add(new_convo)
-            session.commit()
-            session.refresh(new_convo)
-            conversation_id = new_convo.id
+    return new_convo
 
-            current_user.active_conversation_id = conversation_id
-            session.commit()
 
-        history = session.query(Queries).filter_by(
-            user_id=current_user.id,
-            conversation_id=conversation_id
-        ).order_by(Queries.create_at.asc()).all()
-
-        messages = []
-        for q in history:
-            messages.append({"role": "user", "content": q.query_text})
-            messages.append({"role": "assistant", "content": q.response_text})
-        messages.append({"role": "user", "content": data.query_text})
-
-        response = requests.post(
-            url=OPENROUTER_API_URL,
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": SITE_URL,
-                "X-Title": SITE_NAME
-            },
-            json={
-                "model": "deepseek/deepseek-r1-zero:free",
-                "messages": messages
-            }
-        )
-        response.raise_for_status()
-        raw_response = response.json()["choices"][0]["message"]["content"]
-        cleaned_response = clean_response_text(raw_response)
+# Build the upstream context from a branch, dropping the oldest turns when the
+# stored running total says it would not fit
+def context_messages(path: list, query_tokens: int) -> list:
+    budget = MAX_CONTEXT_TOKENS - query_tokens - MESSAGE_OVERHEAD
+    if path and path[-1].context_tokens > budget:
+        path = trim_to_budget(path, budget)
+    return path_messages(path)
+
+
+# Tokens sent upstream for one call, from the same stored counts (trimming
+# drops whole turns, so this is an upper bound once the budget is hit)
+def prompt_tokens(path: list, query_tokens: int) -> int:
+    budget = MAX_CONTEXT_TOKENS - query_tokens - MESSAGE_OVERHEAD
+    return min(path[-1].context_tokens if path else 0, budget) + query_tokens + MESSAGE_OVERHEAD
+
+
+# Backend asked for in the request, else the user's preference, else routed.
+# A stored preference for a backend that is no longer configured is ignored.
+def resolve_backend(requested: Optional[str], current_user: Users) -> Optional[str]:
+    if requested and requested not in llm.backend_names():
+        raise HTTPException(status_code=400, detail=f"Unknown LLM backend. Available: {', '.join(llm.backend_names())}")
+    if requested:
+        return requested
+    return current_user.llm_backend if current_user.llm_backend in llm.backend_names() else None
+
+
+def answer_on_branch(session: Session, current_user: Users, convo: Conversations, parent_id: Optional[int], query_text: str, backend: Optional[str] = None) -> Queries:
+    usage.reserve(session, current_user.id)
+
+    path = ancestor_path(session, parent_id)
+    query_tokens = count_tokens(query_text)
+    messages = context_messages(path, query_tokens)
+    messages.append({"role": "user", "content": query_text})
+    sent_tokens = prompt_tokens(path, query_tokens)
+
+    started = time.perf_counter()
+    try:
+        cleaned_response = llm.complete(messages, backend=backend, clean=True)
+    except llm.LLMError:
+        usage.record(session, current_user.id, sent_tokens, 0, (time.perf_counter() - started) * 1000, requests=0, errors=1)
+        session.commit()
+        raise
+    latency_ms = (time.perf_counter() - started) * 1000
 
+    response_tokens = count_tokens(cleaned_response)
+    added_tokens = turn_tokens(query_tokens, response_tokens)
+    with tracing.span("persist", conversation_id=convo.id):
         new_query = Queries(
             user_id=current_user.id,
-            conversation_id=conversation_id,
-            query_text=data.query_text,
-            response_text=cleaned_response
+            conversation_id=convo.id,
+            parent_id=parent_id,
+            query_text=query_text,
+            response_text=cleaned_response,
+            query_tokens=query_tokens,
+            response_tokens=response_tokens,
+            context_tokens=(path[-1].context_tokens if path else 0) + added_tokens
         )
         session.add(new_query)
+        session.flush()
+        convo.head_query_id = new_query.id
+        convo.token_count = Conversations.token_count + added_tokens
+        current_user.token_count = Users.token_count + added_tokens
+        bump_history_version(session, [current_user.id], [convo.id])
+        usage.record(session, current_user.id, sent_tokens, response_tokens, latency_ms, requests=0)
         session.commit()
         session.refresh(new_query)
 
+    # first turn of a conversation, name it in the background (forks and
+    # regenerations of that turn keep the title it already has)
+    if parent_id is None and convo.title == titles.PLACEHOLDER_TITLE and not (
+        session.query(Queries.id)
+        .filter(Queries.conversation_id == convo.id, Queries.id != new_query.id)
+        .first()
+    ):
+        titles.enqueue(convo.id, query_text, cleaned_response)
+
+    return new_query
+
+
+def get_owned_query(session: Session, current_user: Users, query_id: int) -> Queries:
+    query = session.query(Queries).filter_by(id=query_id, user_id=current_user.id).first()
+    if not query:
+        # the query may belong to an archived conversation
+        convo = archive.find_conversation(session, current_user.id, query_id)
+        if convo:
+            archive.rehydrate(session, [convo])
+            query = session.query(Queries).filter_by(id=query_id, user_id=current_user.id).first()
+    if not query:
+        raise HTTPException(status_code=404, detail="Query not found")
+    return query
+
+
+# Conversation a turn belongs to; rows from before conversations existed have none
+def get_query_conversation(session: Session, current_user: Users, query: Queries) -> Conversations:
+    convo = None
+    if query.conversation_id is not None:
+        convo = session.query(Conversations).filter_by(id=query.conversation_id, user_id=current_user.id).first()
+    if not convo:
+        raise HTTPException(status_code=400, detail="Query is not part of a conversation")
+    return convo
+
+
+@router.post("/")
+def ask_query(
+    data: CreateQuerySchema,
+    session: Session = Depends(get_db),
+    current_user: Users = Depends(get_current_user)
+):
+    try:
+        backend = resolve_backend(data.backend, current_user)
+        convo = get_or_create_conversation(session, current_user, data.conversation_id)
+        new_query = answer_on_branch(session, current_user, convo, convo.head_query_id, data.query_text, backend)
+
         return {
             "query": data.query_text,
-            "response": cleaned_response,
-            "conversation_id": conversation_id
+            "response": new_query.response_text,
+            "conversation_id": convo.id,
+            "query_id": new_query.id
         }
 
-    except requests.exceptions.RequestException as e:
+    except HTTPException:
+        raise
+    except llm.LLMError as e:
         raise HTTPException(status_code=500, detail=f"LLM API error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
     
 
+# Edit an earlier question: the new turn becomes a sibling of the edited one
+@router.post("/fork")
+def fork_query(
+    data: ForkQuerySchema,
+    session: Session = Depends(get_db),
+    current_user: Users = Depends(get_current_user)
+):
+    try:
+        target = get_owned_query(session, current_user, data.query_id)
+        convo = get_query_conversation(session, current_user, target)
+        new_query = answer_on_branch(session, current_user, convo, target.parent_id, data.query_text, resolve_backend(None, current_user))
+
+        return {
+            "query": new_query.query_text,
+            "response": new_query.response_text,
+            "conversation_id": convo.id,
+            "query_id": new_query.id,
+            "parent_id": new_query.parent_id
+        }
+
+    except HTTPException:
+        raise
+    except llm.LLMError as e:
+        raise HTTPException(status_code=500, detail=f"LLM API error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+
+# Ask the same question again from the same point
+@router.post("/regenerate")
+def regenerate_query(
+    data: RegenerateQuerySchema,
+    session: Session = Depends(get_db),
+    current_user: Users = Depends(get_current_user)
+):
+    try:
+        target = get_owned_query(session, current_user, data.query_id)
+        convo = get_query_conversation(session, current_user, target)
+        new_query = answer_on_branch(session, current_user, convo, target.parent_id, target.query_text, resolve_backend(None, current_user))
+
+        return {
+            "query": new_query.query_text,
+            "response": new_query.response_text,
+            "conversation_id": convo.id,
+            "query_id": new_query.id,
+            "parent_id": new_query.parent_id
+        }
+
+    except HTTPException:
+        raise
+    except llm.LLMError as e:
+        raise HTTPException(status_code=500, detail=f"LLM API error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+
+# Switch which branch new queries in a conversation continue from
+@router.post("/conversation/{conversation_id}/head")
+def set_conversation_head(
+    conversation_id: int,
+    data: ConversationHeadSchema,
+    session: Session = Depends(get_db),
+    current_user: Users = Depends(get_current_user)
+):
+    target = get_owned_query(session, current_user, data.query_id)
+    if target.conversation_id != conversation_id:
+        raise HTTPException(status_code=400, detail="Query does not belong to this conversation")
+
+    convo = session.query(Conversations).filter_by(id=conversation_id, user_id=current_user.id).first()
+    convo.head_query_id = target.id
+    bump_history_version(session, [current_user.id], [conversation_id])
+    session.commit()
+
+    return {
+        "conversation_id": conversation_id,
+        "head_query_id": target.id,
+        "path": [
+            {"query_id": q.id, "question": q.query_text, "response": q.response_text}
+            for q in ancestor_path(session, target.id)
+        ]
+    }
+
+
+# Batch queries for evaluation runs, streamed back as NDJSON in completion order
+@router.post("/batch")
+def ask_batch(
+    data: BatchQuerySchema,
+    session: Session = Depends(get_db),
+    current_user: Users = Depends(get_current_user)
+):
+    if not data.queries:
+        raise HTTPException(status_code=400, detail="No queries to run")
+    if len(data.queries) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {BATCH_MAX_ITEMS} queries")
+
+    concurrency = max(1, min(data.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    batch_backend = resolve_backend(data.backend, current_user)
+    for item in data.queries:
+        resolve_backend(item.backend, current_user)
+
+    # Bound items see their conversation's history as it was when the batch started,
+    # and are stored as sibling branches off that point without moving the head
+    requested_ids = {item.conversation_id for item in data.queries if item.conversation_id}
+    owned = (
+        session.query(Conversations)
+        .filter(Conversations.user_id == current_user.id, Conversations.id.in_(requested_ids))
+        .all()
+    ) if requested_ids else []
+    owned_ids = {convo.id for convo in owned}
+
+    # Every item that will reach the upstream counts against the per-minute
+    # quota: the whole batch must fit in what is left, and is reserved in the
+    # ledger up front. Items only add their tokens, latency and errors when
+    # they finish.
+    upstream = sum(1 for item in data.queries if not item.conversation_id or item.conversation_id in owned_ids)
+    if upstream:
+        reserved_at = usage.reserve(session, current_user.id, requests=upstream)
+    else:
+        usage.check_quota(session, current_user.id)
+
+    archive.rehydrate(session, owned)
+    # Unbound items run without history and are stored together in one new conversation
+    batch_conversation_id = None
+    if any(not item.conversation_id for item in data.queries):
+        batch_convo = Conversations(user_id=current_user.id, title="Batch Run")
+        session.add(batch_convo)
+        session.flush()
+        bump_history_version(session, [current_user.id], [batch_convo.id])
+        session.commit()
+        batch_conversation_id = batch_convo.id
+
+    # Loaded after the last commit so worker threads only read plain attributes
+    heads = dict(
+        session.query(Conversations.id, Conversations.head_query_id)
+        .filter(Conversations.id.in_(owned_ids))
+    ) if owned_ids else {}
+    paths = {cid: ancestor_path(session, head) for cid, head in heads.items()}
+
+    user_id = current_user.id
+
+    # Returns the streamed result and the ledger entry for the item (None when
+    # nothing was sent upstream)
+    def run_item(index: int, item: CreateQuerySchema) -> tuple:
+        conversation_id = item.conversation_id or batch_conversation_id
+        if item.conversation_id and item.conversation_id not in owned_ids:
+            return {"index": index, "conversation_id": conversation_id, "error": "Conversation not found"}, None
+
+        path = paths.get(item.conversation_id, [])
+        query_tokens = count_tokens(item.query_text)
+        messages = context_messages(path, query_tokens)
+        messages.append({"role": "user", "content": item.query_text})
+        sent_tokens = prompt_tokens(path, query_tokens)
+        started = time.perf_counter()
+        try:
+            response_text = llm.complete(messages, backend=item.backend or batch_backend, clean=True)
+        except Exception as e:
+            ledger = (sent_tokens, 0, (time.perf_counter() - started) * 1000, 1)
+            if isinstance(e, llm.LLMError):
+                return {"index": index, "conversation_id": conversation_id, "error": f"LLM API error: {str(e)}"}, ledger
+            return {"index": index, "conversation_id": conversation_id, "error": f"Internal error: {str(e)}"}, ledger
+
+        response_tokens = count_tokens(response_text)
+        added_tokens = turn_tokens(query_tokens, response_tokens)
+        ledger = (sent_tokens, response_tokens, (time.perf_counter() - started) * 1000, 0)
+        return {
+            "index": index,
+            "query": item.query_text,
+            "response": response_text,
+            "conversation_id": conversation_id,
+            "query_tokens": query_tokens,
+            "response_tokens": response_tokens,
+            "context_tokens": (path[-1].context_tokens if path else 0) + added_tokens
+        }, ledger
+
+    def stream():
+        inflight.enter()
+        db = SessionLocal()
+        pending = []
+        ledger = [0, 0, 0, 0, 0]  # calls, prompt, completion, latency, errors
+        counts = {"completed": 0, "failed": 0}
+        consumed = set()
+        sent = [0]  # upstream calls made, against the `upstream` reserved
+
+        def flush():
+            if ledger[0]:
+                # the requests themselves were reserved when the batch started
+                usage.record(db, user_id, ledger[1], ledger[2], ledger[3], requests=0, errors=ledger[4])
+            if pending:
+                db.execute(insert(Queries), pending)
+
+                added = {}
+                for row in pending:
+                    tokens = turn_tokens(row["query_tokens"], row["response_tokens"])
+                    added[row["conversation_id"]] = added.get(row["conversation_id"], 0) + tokens
+                for cid, tokens in added.items():
+                    db.execute(
+                        update(Conversations).where(Conversations.id == cid)
+                        .values(token_count=Conversations.token_count + tokens)
+                    )
+                db.execute(
+                    update(Users).where(Users.id == user_id)
+                    .values(token_count=Users.token_count + sum(added.values()))
+                )
+                bump_history_version(db, [user_id], added)
+            db.commit()
+            # cleared only once committed, so a failed flush can be retried
+            ledger[:] = [0, 0, 0, 0, 0]
+            pending.clear()
+
+        def collect(future) -> dict:
+            consumed.add(future)
+            result, item_usage = future.result()
+            if item_usage:
+                sent[0] += 1
+                ledger[0] += 1
+                for i, value in enumerate(item_usage, start=1):
+                    ledger[i] += value
+            if "error" in result:
+                counts["failed"] += 1
+            else:
+                counts["completed"] += 1
+                pending.append({
+                    "user_id": user_id,
+                    "conversation_id": result["conversation_id"],
+                    "parent_id": heads.get(result["conversation_id"]),
+                    "query_text": result["query"],
+                    "response_text": result["response"],
+                    "query_tokens": result["query_tokens"],
+                    "response_tokens": result["response_tokens"],
+                    "context_tokens": result["context_tokens"],
+                    "create_at": datetime.now(),
+                    "updated_at": datetime.now()
+                })
+            return result
+
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        futures = []
+        try:
+            # each worker gets its own copy of the request context for tracing
+            futures = [
+                pool.submit(contextvars.copy_context().run, run_item, i, item)
+                for i, item in enumerate(data.queries)
+            ]
+            for future in as_completed(futures):
+                result = collect(future)
+                if len(pending) >= BATCH_INSERT_SIZE:
+                    flush()
+                yield json.dumps(result, default=str) + "\n"
+            flush()
+            yield json.dumps({"done": True, **counts}) + "\n"
+        finally:
+            # On a client disconnect or a failed write, items that have not
+            # started are cancelled and their reserved requests given back.
+            # Answers already paid for upstream are still stored.
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
+            try:
+                for future in futures:
+                    if future not in consumed and not future.cancelled():
+                        collect(future)
+                unsent = upstream - sent[0]
+                if pending or ledger[0] or unsent > 0:
+                    db.rollback()
+                    if unsent > 0:
+                        usage.record(db, user_id, requests=-unsent, now=reserved_at)
+                    flush()
+            except Exception as e:
+                db.rollback()
+                logger.error("Batch flush failed, %d answers not stored: %s", len(pending), e)
+            finally:
+                db.close()
+                inflight.exit()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 # Reset conversation (start fresh, reset active_conversation_id)
 @router.post("/reset")
 def reset_conversation(
@@ -117,6 +478,7 @@ def reset_conversation(
         session.refresh(new_convo)
 
         current_user.active_conversation_id = new_convo.id
+        bump_history_version(session, [current_user.id], [new_convo.id])
         session.commit()
 
         return {
@@ -128,43 +490,139 @@ def reset_conversation(
         raise HTTPException(status_code=500, detail=f"Failed to reset conversation: {str(e)}")
     
 
+# Token usage from the running totals stored at insert time
+@router.get("/usage")
+def get_usage(
+    conversation_id: Optional[int] = None,
+    session: Session = Depends(get_history_db),
+    current_user: Users = Depends(get_current_user)
+):
+    query = (
+        session.query(Conversations.id, Conversations.title, Conversations.token_count, Queries.context_tokens)
+        .outerjoin(Queries, Queries.id == Conversations.head_query_id)
+        .filter(Conversations.user_id == current_user.id)
+    )
+    if conversation_id is not None:
+        query = query.filter(Conversations.id == conversation_id)
+    # the total from the same session as the per-conversation rows
+    user = serving_user(session, current_user)
+
+    return {
+        "total_tokens": user.token_count if user is not None else 0,
+        "max_context_tokens": MAX_CONTEXT_TOKENS,
+        "quota": usage.current_usage(session, current_user.id),
+        "conversations": [
+            {
+                "conversation_id": cid,
+                "title": title,
+                "total_tokens": token_count,
+                "context_tokens": context_tokens or 0
+            } for cid, title, token_count, context_tokens in query.order_by(Conversations.id.desc())
+        ]
+    }
+
+
+# Full history as a list, or a delta object with the conversations changed
+# since ?since_version= (the "version" of the previous delta, exact) or
+# ?since= (a timestamp, inclusive to the second, so the boundary second may
+# repeat), plus the ids deleted since then. Clients that send back the ETag
+# (or Last-Modified) get a 304 while nothing has changed.
+# With ?limit= the newest conversations come first and X-Next-Cursor, passed
+# back as ?cursor=, fetches the next page. Archived conversations are read
+# from their archive file in place.
 @router.get("/history")
 def get_full_history(
-    session: Session = Depends(get_db),
+    request: Request,
+    since: Optional[datetime] = None,
+    since_version: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[int] = None,
+    session: Session = Depends(get_history_db),
     current_user: Users = Depends(get_current_user)
 ):
-    conversations = (
-        session.query(Conversations)
-        .filter_by(user_id=current_user.id)
-        .order_by(Conversations.updated_at.desc()) 
-        .all()
-    )
-
-    full_history = []
-
-    for convo in conversations:
+    user = serving_user(session, current_user)
+    headers = cache_headers(user)
+    if is_not_modified(request, user):
+        return Response(status_code=304, headers=headers)
+
+    query = session.query(Conversations).filter_by(user_id=current_user.id)
+    tombstones = session.query(ConversationTombstone.conversation_id).filter_by(user_id=current_user.id)
+    if since is not None:
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        # updated_at has whole-second precision (and SQLite compares the stored
+        # text), so ">= since's second" is written as "> one microsecond before it"
+        since = since.replace(microsecond=0) - timedelta(microseconds=1)
+        query = query.filter(Conversations.updated_at > since)
+        tombstones = tombstones.filter(ConversationTombstone.deleted_at > since)
+    if since_version is not None:
+        query = query.filter(Conversations.changed_version > since_version)
+        tombstones = tombstones.filter(ConversationTombstone.version > since_version)
+    if cursor is not None:
+        # the cursor is the last conversation of the previous page; its stored
+        # updated_at is compared in SQL so no timestamp round-trips through the client
+        anchor = session.query(Conversations.updated_at).filter_by(id=cursor, user_id=current_user.id).first()
+        if anchor is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        anchor_updated_at = (
+            session.query(Conversations.updated_at).filter(Conversations.id == cursor).scalar_subquery()
+        )
+        query = query.filter(or_(
+            Conversations.updated_at < anchor_updated_at,
+            and_(Conversations.updated_at == anchor_updated_at, Conversations.id < cursor)
+        ))
+    query = query.order_by(Conversations.updated_at.desc(), Conversations.id.desc())
+    conversations = query.limit(limit).all() if limit else query.all()
+
+    if limit and len(conversations) == limit:
+        headers["X-Next-Cursor"] = str(conversations[-1].id)
+
+    queries_by_conversation = {convo.id: [] for convo in conversations}
+    hot_ids = [convo.id for convo in conversations if not convo.archive_month]
+    if hot_ids:
         queries = (
             session.query(Queries)
-            .filter_by(user_id=current_user.id, conversation_id=convo.id)
-            .order_by(Queries.updated_at.desc())  
-            .all()
+            .filter(Queries.user_id == current_user.id, Queries.conversation_id.in_(hot_ids))
+            .order_by(Queries.updated_at.desc())
         )
+        for q in queries:
+            queries_by_conversation[q.conversation_id].append(q)
+    for cid, archived in archive.archived_queries(conversations).items():
+        queries_by_conversation[cid] = sorted(archived, key=lambda q: q.updated_at, reverse=True)
 
+    full_history = []
+
+    for convo in conversations:
         full_history.append({
             "conversation_id": convo.id,
             "title": convo.title,
+            "head_query_id": convo.head_query_id,
             "created_at": convo.created_at,
             "updated_at": convo.updated_at,  
             "queries": [
                 {
+                    "query_id": q.id,
+                    "parent_id": q.parent_id,
                     "question": q.query_text,
                     "response": q.response_text,
                     "updated_at": q.updated_at 
-                } for q in queries
+                } for q in queries_by_conversation[convo.id]
             ]
         })
 
-    return full_history
+    if since is not None or since_version is not None:
+        return JSONResponse(content=jsonable_encoder({
+            "version": user.history_version if user is not None else 0,
+            "conversations": full_history,
+            # a tombstone for an id that is live again (reused before
+            # conversations stopped reusing ids) would delete the wrong one
+            "deleted": sorted({row.conversation_id for row in tombstones.filter(
+                ~session.query(Conversations.id)
+                .filter(Conversations.id == ConversationTombstone.conversation_id, Conversations.user_id == current_user.id)
+                .exists()
+            )})
+        }), headers=headers)
+    return JSONResponse(content=jsonable_encoder(full_history), headers=headers)
 
 
 # Route to delete a conversation and all associated queries
@@ -180,9 +638,12 @@ def delete_conversation(
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
 
-       
+        archive_month = conversation.archive_month
         session.delete(conversation)
+        bump_history_version(session, [current_user.id], deleted=[(conversation_id, current_user.id)])
         session.commit()
+        if archive_month:
+            archive.remove(archive_month, [conversation_id])
 
         if current_user.active_conversation_id == conversation_id:
             current_user.active_conversation_id = None  # Reset the active conversation
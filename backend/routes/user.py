@@ -1,9 +1,11 @@
 
+from typing import Optional
 from fastapi import  Depends, HTTPException, APIRouter
 from sqlalchemy.orm import Session
-from models import get_db, Users, RevokedToken
-from schemas import CreateUserSchema, LoginUserSchema, UpdateUserSchema
-from auth import signJWT, hash_password, verify_password, get_current_user, JWTBearer
+from models import get_db, Users
+from schemas import CreateUserSchema, LoginUserSchema, UpdateUserSchema, RefreshTokenSchema
+import llm
+from auth import signJWT, hash_password, verify_password, get_current_user, JWTBearer, decodeJWT, revoke_token, is_revoked
 
 
 router = APIRouter(
@@ -41,6 +43,25 @@ def user_login(user: LoginUserSchema, session: Session = Depends(get_db)):
     return signJWT(db_user.id)
 
 
+# Refresh (rotates the refresh token)
+@router.post("/refresh", tags=["user"])
+def refresh_token(data: RefreshTokenSchema, session: Session = Depends(get_db)):
+    payload = decodeJWT(data.refresh_token)
+    if not payload or payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token.")
+
+    if is_revoked(session, payload):
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked.")
+
+    db_user = session.query(Users).filter_by(id=payload["user_id"]).first()
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    revoke_token(session, payload)
+    session.commit()
+    return signJWT(db_user.id)
+
+
 # Current User
 @router.get("/current_user", tags=["user"])
 def read_current_user(current_user: Users = Depends(get_current_user)):
@@ -48,6 +69,7 @@ def read_current_user(current_user: Users = Depends(get_current_user)):
         "id": current_user.id,
         "name": current_user.name,
         "email": current_user.email,
+        "llm_backend": current_user.llm_backend,
     }
 
 # Update User
@@ -66,6 +88,13 @@ def update_user(updates: UpdateUserSchema, session: Session = Depends(get_db), c
         current_user.password = hash_password(updates.password)
         updated = True
 
+    if updates.llm_backend is not None:
+        # an empty string goes back to latency-based routing
+        if updates.llm_backend and updates.llm_backend not in llm.backend_names():
+            raise HTTPException(status_code=400, detail=f"Unknown LLM backend. Available: {', '.join(llm.backend_names())}")
+        current_user.llm_backend = updates.llm_backend or None
+        updated = True
+
     if updated:
         session.commit()
         session.refresh(current_user)
@@ -73,7 +102,8 @@ def update_user(updates: UpdateUserSchema, session: Session = Depends(get_db), c
             "message": "User updated successfully",
             "user": {
                 "id": current_user.id,
-                "email": current_user.email
+                "email": current_user.email,
+                "llm_backend": current_user.llm_backend
             }
         }
     else:
@@ -81,8 +111,17 @@ def update_user(updates: UpdateUserSchema, session: Session = Depends(get_db), c
     
 # Logout 
 @router.delete("/logout", tags=["user"])
-def logout(token: str = Depends(JWTBearer()), session: Session = Depends(get_db)):
-    revoked_token = RevokedToken(token=token)
-    session.add(revoked_token)
+def logout(
+    data: Optional[RefreshTokenSchema] = None,
+    token: str = Depends(JWTBearer()),
+    session: Session = Depends(get_db)
+):
+    revoke_token(session, decodeJWT(token))
+
+    if data:
+        refresh_payload = decodeJWT(data.refresh_token)
+        if refresh_payload and refresh_payload.get("type") == "refresh":
+            revoke_token(session, refresh_payload)
+
     session.commit()
     return {"message": "Successfully logged out"}
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 
@@ -33,12 +33,24 @@ class LoginUserSchema(BaseModel):
 class UpdateUserSchema(BaseModel):
     email: Optional[EmailStr]
     password: Optional[str]
+    llm_backend: Optional[str] = None
 
     class Config:
         schema_extra = {
             "example": {
                 "email": "newemail@example.com",
-                "password": "newpassword"
+                "password": "newpassword",
+                "llm_backend": "local"
+            }
+        }
+
+class RefreshTokenSchema(BaseModel):
+    refresh_token: str
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "refresh_token": "<JWT Refresh Token>"
             }
         }
 
@@ -46,12 +58,63 @@ class UpdateUserSchema(BaseModel):
 class CreateQuerySchema(BaseModel):
     query_text: str
     conversation_id: Optional[int] = None
+    backend: Optional[str] = None
 
     class Config:
         schema_extra = {
             "example": {
                 "query_text": "What is the weather like today?",
-                "conversation_id": 1
+                "conversation_id": 1,
+                "backend": "openrouter"
+            }
+        }
+
+class BatchQuerySchema(BaseModel):
+    queries: List[CreateQuerySchema]
+    concurrency: Optional[int] = None
+    backend: Optional[str] = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "queries": [
+                    {"query_text": "What is the capital of France?"},
+                    {"query_text": "And its population?", "conversation_id": 1}
+                ],
+                "concurrency": 4,
+                "backend": "local"
+            }
+        }
+
+class ForkQuerySchema(BaseModel):
+    query_id: int
+    query_text: str
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "query_id": 3,
+                "query_text": "What about travelling from Kenya to Germany?"
+            }
+        }
+
+class RegenerateQuerySchema(BaseModel):
+    query_id: int
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "query_id": 3
+            }
+        }
+
+class ConversationHeadSchema(BaseModel):
+    query_id: int
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "query_id": 5
             }
         }
 
@@ -0,0 +1,100 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Startup-time budget for the API process, also run by tests/test_startup.py.
+# From the backend directory (pipenv run test runs it with the other tests):
+#   pipenv run startup-check            report, exit non-zero over budget
+#   python startup_check.py --record    record this machine's baseline
+# The budget is the recorded baseline (startup_baseline.json) times
+# STARTUP_TOLERANCE, or IMPORT_BUDGET_MS / READY_BUDGET_MS when set or when
+# nothing is recorded. Over budget, the slowest imports are printed so the
+# regression is easy to find.
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, "startup_baseline.json")
+STARTUP_TOLERANCE = float(os.getenv("STARTUP_TOLERANCE", "1.5"))
+DEFAULT_BUDGETS = {"import_ms": 1500.0, "ready_ms": 2500.0}
+
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def budgets() -> dict:
+    result = dict(DEFAULT_BUDGETS)
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+        result.update({name: baseline[name] * STARTUP_TOLERANCE for name in result if name in baseline})
+    for name, env in (("import_ms", "IMPORT_BUDGET_MS"), ("ready_ms", "READY_BUDGET_MS")):
+        if os.getenv(env):
+            result[name] = float(os.getenv(env))
+    return result
+
+
+def _run(code: str, *flags) -> subprocess.CompletedProcess:
+    result = subprocess.run([sys.executable, *flags, "-c", code], capture_output=True, text=True, cwd=HERE)
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup measurement failed:\n{result.stderr}")
+    return result
+
+
+# Both measurements run in a fresh interpreter, so modules already imported
+# by the caller (a test run, say) do not hide their cost, and keep the best
+# of `runs` so a busy machine does not read as a regression
+def measure_imports(runs: int = 1):
+    return min((_measure_imports_once() for _ in range(runs)), key=lambda measured: measured[0])
+
+
+def _measure_imports_once():
+    result = _run("import main", "-X", "importtime")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            rows.append((int(match.group(2)), int(match.group(1)), match.group(4)))
+    total_us = next(cumulative for cumulative, _, name in rows if name == "main")
+    return total_us / 1000, sorted(rows, key=lambda row: row[1], reverse=True)[:10]
+
+
+# Import main and run the lifespan startup, like uvicorn would
+READY_CODE = """
+import asyncio, time
+started = time.perf_counter()
+import main
+
+async def start_and_stop():
+    async with main.app.router.lifespan_context(main.app):
+        return (time.perf_counter() - started) * 1000
+
+print(asyncio.run(start_and_stop()))
+"""
+
+
+def measure_ready(runs: int = 1) -> float:
+    return min(float(_run(READY_CODE).stdout.strip().splitlines()[-1]) for _ in range(runs))
+
+
+if __name__ == "__main__":
+    import_ms, slowest = measure_imports(runs=3)
+    ready_ms = measure_ready(runs=3)
+
+    if "--record" in sys.argv:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump({"import_ms": round(import_ms), "ready_ms": round(ready_ms)}, f, indent=2)
+            f.write("\n")
+        print(f"Recorded baseline: import {import_ms:.0f} ms, ready {ready_ms:.0f} ms")
+        sys.exit(0)
+
+    budget = budgets()
+    print(f"import main: {import_ms:.0f} ms (budget {budget['import_ms']:.0f} ms)")
+    print(f"app ready:   {ready_ms:.0f} ms (budget {budget['ready_ms']:.0f} ms)")
+    print("slowest modules (self time):")
+    for _, self_us, name in slowest:
+        print(f"  {self_us / 1000:7.1f} ms  {name}")
+
+    if import_ms > budget["import_ms"] or ready_ms > budget["ready_ms"]:
+        print("❌ Startup budget exceeded.")
+        sys.exit(1)
+    print("✅ Startup within budget.")
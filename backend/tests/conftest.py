@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Run from backend/: python -m pytest tests
+# Modules read their settings at import, so the environment is set up before
+# any of them is imported: a throwaway SQLite database and archive directory.
+_tmp = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("secret", "test-secret")
+os.environ.setdefault("algorithm", "HS256")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'app.db')}"
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ["ARCHIVE_DIR"] = os.path.join(_tmp, "archive")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
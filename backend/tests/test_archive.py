@@ -0,0 +1,140 @@
+import shutil
+
+import pytest
+from sqlalchemy import text, update
+
+import archive
+import config
+import models
+from models import Conversations, Queries, Users
+
+
+@pytest.fixture
+def session():
+    models.Base.metadata.create_all(models.engine)
+    db = models.Session()
+    try:
+        yield db
+    finally:
+        db.close()
+        with models.engine.begin() as conn:
+            for table in ("queries", "conversations", "users"):
+                conn.execute(text(f"DELETE FROM {table}"))
+        shutil.rmtree(config.ARCHIVE_DIR, ignore_errors=True)
+
+
+# A conversation whose created_at/updated_at come from the server default,
+# aged with SQLite's own datetime() so the stored text has no fractional seconds
+def cold_conversation(session, days: int = 200) -> int:
+    user = Users(name="a", email="a@example.com", password="x")
+    session.add(user)
+    session.flush()
+    convo = Conversations(user_id=user.id, title="Old")
+    session.add(convo)
+    session.flush()
+    for i in range(2):
+        session.add(Queries(user_id=user.id, conversation_id=convo.id, query_text=f"q{i}", response_text=f"a{i}"))
+    session.commit()
+    session.execute(
+        text(f"UPDATE conversations SET updated_at = datetime('now', '-{days} days') WHERE id = :id"),
+        {"id": convo.id}
+    )
+    session.commit()
+    return convo.id
+
+
+def test_archives_server_default_timestamps(session):
+    cid = cold_conversation(session)
+    assert "." not in session.execute(text("SELECT updated_at FROM conversations")).scalar()
+
+    assert archive.archive_cold_conversations(session) == 1
+    convo = session.get(Conversations, cid)
+    session.refresh(convo)
+    assert convo.archive_month is not None
+    assert session.query(Queries).count() == 0
+    assert [row["query_text"] for row in archive.read(convo.archive_month, [cid])[cid]] == ["q0", "q1"]
+
+    # nothing left to do, and the archive copy stays
+    assert archive.archive_cold_conversations(session) == 0
+    assert cid in archive.read(convo.archive_month, [cid])
+
+
+def test_skips_conversation_written_during_archive(session, monkeypatch):
+    cid = cold_conversation(session)
+    write = archive.write
+
+    def write_then_touch(month, entries):
+        write(month, entries)
+        other = models.Session()
+        other.execute(update(Conversations).where(Conversations.id == cid).values(title="Touched"))
+        other.commit()
+        other.close()
+
+    monkeypatch.setattr(archive, "write", write_then_touch)
+    assert archive.archive_cold_conversations(session) == 0
+    assert session.query(Queries).count() == 2
+    assert session.get(Conversations, cid).archive_month is None
+    month = session.execute(text("SELECT strftime('%Y-%m', 'now', '-200 days')")).scalar()
+    assert archive.read(month, [cid]) == {}
+
+
+def test_disabled(session, monkeypatch):
+    cold_conversation(session)
+    monkeypatch.setattr(config, "ARCHIVE_AFTER_DAYS", 0)
+    assert archive.archive_cold_conversations(session) == 0
+
+
+def test_rehydrate_after_new_queries(session):
+    cid = cold_conversation(session)
+    archived_ids = [q.id for q in session.query(Queries).order_by(Queries.id)]
+    session.execute(update(Conversations).where(Conversations.id == cid).values(head_query_id=archived_ids[-1]))
+    session.commit()
+    session.execute(
+        text("UPDATE conversations SET updated_at = datetime('now', '-200 days') WHERE id = :id"), {"id": cid}
+    )
+    session.commit()
+    assert archive.archive_cold_conversations(session) == 1
+
+    # the archived rows held the highest ids; new queries must not take them
+    other = Conversations(user_id=session.get(Conversations, cid).user_id)
+    session.add(other)
+    session.flush()
+    new = [Queries(user_id=other.user_id, conversation_id=other.id, query_text="n", response_text="n") for _ in range(3)]
+    session.add_all(new)
+    session.commit()
+    assert not {q.id for q in new} & set(archived_ids)
+
+    archive.rehydrate(session, [session.get(Conversations, cid)])
+    restored = session.query(Queries).filter(Queries.conversation_id == cid).order_by(Queries.id).all()
+    assert [q.id for q in restored] == archived_ids
+    assert session.get(Conversations, cid).archive_month is None
+
+
+# Databases archived before queries used AUTOINCREMENT may already have
+# handed archived ids to new queries
+def test_rehydrate_remaps_reused_ids(session):
+    cid = cold_conversation(session)
+    first, second = [q.id for q in session.query(Queries).order_by(Queries.id)]
+    session.execute(update(Queries).where(Queries.id == second).values(parent_id=first))
+    session.execute(update(Conversations).where(Conversations.id == cid).values(head_query_id=second))
+    session.execute(
+        text("UPDATE conversations SET updated_at = datetime('now', '-200 days') WHERE id = :id"), {"id": cid}
+    )
+    session.commit()
+    assert archive.archive_cold_conversations(session) == 1
+
+    other = Conversations(user_id=session.get(Conversations, cid).user_id)
+    session.add(other)
+    session.flush()
+    session.add(Queries(id=first, user_id=other.user_id, conversation_id=other.id, query_text="n", response_text="n"))
+    session.commit()
+
+    archive.rehydrate(session, [session.get(Conversations, cid)])
+    restored = session.query(Queries).filter(Queries.conversation_id == cid).order_by(Queries.id).all()
+    assert [q.query_text for q in restored] == ["q0", "q1"]
+    assert first not in {q.id for q in restored}
+    assert restored[1].parent_id == restored[0].id
+    convo = session.get(Conversations, cid)
+    session.refresh(convo)
+    assert convo.head_query_id == restored[1].id
+    assert session.get(Queries, first).conversation_id == other.id
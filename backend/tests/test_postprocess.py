@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from postprocess import Pipeline, TRANSFORM_ORDER, THINK_LEAD, DEFAULT_TRANSFORMS
+
+PIPELINE = Pipeline(TRANSFORM_ORDER)
+DEFAULT = Pipeline(DEFAULT_TRANSFORMS)
+
+
+def streamed(text: str, sizes) -> str:
+    processor = PIPELINE.stream()
+    parts = []
+    i = 0
+    for size in sizes:
+        parts.append(processor.feed(text[i:i + size]))
+        i += size
+    parts.append(processor.feed(text[i:]))
+    parts.append(processor.finish())
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("<think>plan</think>\n\nThe answer is \\boxed{42}.", "The answer is 42."),
+    ("R1 style reasoning, no opening tag</think>\n\nAnswer.", "Answer."),
+    ("Answer <think>cut off mid reasoning", "Answer cut off mid reasoning"),
+    ("<think>cut off right away  ", "cut off right away"),
+    ("<think>one</think>two<think>three", "twothree"),
+    ("Mail jane@example.com or call 555-123-4567 today.", "Mail [email] or call [phone] today."),
+    ("a  \n\n\n\nb\r\nc", "a\n\nb\nc"),
+    ("hard  \nbreak, soft \nbreak", "hard  \nbreak, soft\nbreak"),
+    ("x\n\n\n```py\nif a:  \n\n\n    b()   \n```\n\n\ny", "x\n\n```py\nif a:  \n\n\n    b()   \n```\n\ny"),
+    ("~~~\n a \n\n\n b\n~~~", "~~~\n a \n\n\n b\n~~~"),
+])
+def test_process(text, expected):
+    assert PIPELINE.process(text) == expected
+
+
+# the lone </think> rule is opt-in, so ordinary answers that mention the tag keep it
+def test_default_keeps_lone_close():
+    assert "think_lead" not in DEFAULT_TRANSFORMS
+    text = "Use the </think> tag to close reasoning. Then more."
+    assert DEFAULT.process(text) == text
+
+
+def test_lone_close_past_lead_keeps_text():
+    text = "x " * THINK_LEAD + "</think> y"
+    assert PIPELINE.process(text) == ("x " * THINK_LEAD).rstrip() + "  y"
+
+
+PIECES = [
+    "<think>", "</think>", "<thi", "nk>", "</", "\\boxed{", "{", "}", "x^{2}",
+    "jane@example.com", "@", "555-123-4567", "(555) 123-4567", "+1-555-123-4567",
+    " ", "  ", "\t", "\n", "\r\n", "\n\n\n", " \n ", "  \n", "word", "a.b", "1", ".",
+    "\n```", "\n```py\n", "```", "~~~", "\n~~~\n",
+]
+
+
+@pytest.mark.parametrize("seed", range(3000))
+def test_chunked_matches_whole(seed):
+    rng = random.Random(seed)
+    text = "".join(rng.choice(PIECES) for _ in range(rng.randint(1, 40)))
+    sizes = [rng.randint(1, 7) for _ in range(len(text))]
+    assert streamed(text, sizes) == PIPELINE.process(text), text
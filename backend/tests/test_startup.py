@@ -0,0 +1,15 @@
+import models
+import startup_check
+
+
+# Fails when importing main or reaching app-ready regresses past the budget
+# (the recorded baseline times STARTUP_TOLERANCE, see startup_check.py)
+def test_startup_within_budget():
+    models.Base.metadata.create_all(models.engine)
+    budget = startup_check.budgets()
+
+    import_ms, slowest = startup_check.measure_imports(runs=3)
+    assert import_ms <= budget["import_ms"], f"import main took {import_ms:.0f} ms, slowest: {slowest[:5]}"
+
+    ready_ms = startup_check.measure_ready(runs=3)
+    assert ready_ms <= budget["ready_ms"], f"app ready took {ready_ms:.0f} ms"
@@ -0,0 +1,84 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+import models
+import usage
+from models import UsageRollup, Users
+
+
+@pytest.fixture
+def user_id():
+    models.Base.metadata.create_all(models.engine)
+    db = models.Session()
+    user = Users(name="u", email="u@example.com", password="x")
+    db.add(user)
+    db.commit()
+    try:
+        yield user.id
+    finally:
+        db.close()
+        with models.engine.begin() as conn:
+            for table in ("usage_rollups", "users"):
+                conn.execute(text(f"DELETE FROM {table}"))
+
+
+def minute_requests(user_id: int) -> dict:
+    db = models.Session()
+    try:
+        return {
+            row.bucket_start: row.requests
+            for row in db.query(UsageRollup).filter_by(user_id=user_id, granularity="minute")
+        }
+    finally:
+        db.close()
+
+
+def test_reserve_refuses_past_quota(user_id, monkeypatch):
+    monkeypatch.setattr(usage, "QUOTA_REQUESTS_PER_MINUTE", 3)
+    db = models.Session()
+    usage.reserve(db, user_id, requests=2)
+    with pytest.raises(HTTPException) as refused:
+        usage.reserve(db, user_id, requests=2)
+    assert refused.value.status_code == 429
+    usage.reserve(db, user_id)
+    db.close()
+    assert sum(minute_requests(user_id).values()) == 3
+
+
+def test_concurrent_reservations_stay_within_quota(user_id, monkeypatch):
+    monkeypatch.setattr(usage, "QUOTA_REQUESTS_PER_MINUTE", 5)
+    granted = []
+
+    def call():
+        db = models.Session()
+        try:
+            usage.reserve(db, user_id)
+            granted.append(1)
+        except HTTPException:
+            pass
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=call) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 0 < len(granted) <= 5
+    assert sum(minute_requests(user_id).values()) == len(granted)
+
+
+# A batch that started minutes ago and is cancelled now gives its unsent
+# requests back to the minute it reserved them in
+def test_refund_goes_to_reservation_bucket(user_id):
+    db = models.Session()
+    reserved_at = datetime.utcnow() - timedelta(minutes=2)
+    usage.record(db, user_id, requests=3, now=reserved_at)
+    usage.record(db, user_id, requests=-2, now=reserved_at)
+    db.commit()
+    db.close()
+    assert minute_requests(user_id) == {usage.bucket_start("minute", reserved_at): 1}
@@ -0,0 +1,156 @@
+import re
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import update, bindparam
+
+import config
+import llm
+import metrics
+from lifespan import on_shutdown
+from history import bump_history_version
+from models import Session, Conversations
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_TITLE = "New Conversation"
+MAX_TITLE_LENGTH = 60
+
+WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9'\-]+")
+TITLE_STRIP = " \"'#*."
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers him his how i if in into is it its itself just know let
+like make me more most my need no nor not now of off on once only or other our out over own please
+same she should so some such tell than that the their them then there these they this those
+through to too under until up use very want was we were what when where which while who whom
+why will with would you your
+""".split())
+
+_pool = None
+_jobs = set()  # queued or running title jobs
+_pending = {}
+_pending_lock = threading.Lock()
+_flush_timer = None
+
+
+def keyword_title(text: str) -> str:
+    words = [w for w in WORD_RE.findall(text) if w.lower() not in STOPWORDS]
+    if not words:
+        return text.strip()[:MAX_TITLE_LENGTH] or PLACEHOLDER_TITLE
+
+    counts = Counter(w.lower() for w in words)
+    top = {word for word, _ in counts.most_common(5)}
+    keep, used = [], set()
+    for word in words:
+        key = word.lower()
+        if key in top and key not in used:
+            keep.append(word[:1].upper() + word[1:])
+            used.add(key)
+    return " ".join(keep)[:MAX_TITLE_LENGTH]
+
+
+def summarize_title(query_text: str, response_text: str) -> str:
+    raw = llm.complete([{
+        "role": "user",
+        "content": (
+            "Write a short title (at most 6 words) for a conversation that starts like this. "
+            "Reply with the title only.\n\n"
+            f"Question: {query_text[:500]}\nAnswer: {response_text[:500]}"
+        )
+    }], model=config.TITLE_MODEL, backend=config.TITLE_BACKEND, clean=True)
+    title = raw.splitlines()[0].strip(TITLE_STRIP) if raw else ""
+    return title[:MAX_TITLE_LENGTH]
+
+
+def _generate(conversation_id: int, query_text: str, response_text: str):
+    title = None
+    # back off to the local extractor whenever user-facing calls need the upstream
+    if not llm.saturated():
+        try:
+            title = summarize_title(query_text, response_text)
+            metrics.incr("titles.llm")
+        except Exception as e:
+            logger.warning("Title generation failed for conversation %s: %s", conversation_id, e)
+    if not title:
+        title = keyword_title(query_text)
+        metrics.incr("titles.keyword")
+
+    with _pending_lock:
+        _pending[conversation_id] = title
+        should_flush = len(_pending) >= config.TITLE_FLUSH_SIZE
+    if should_flush:
+        flush()
+    else:
+        _schedule_flush()
+
+
+def _schedule_flush():
+    global _flush_timer
+    with _pending_lock:
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(config.TITLE_FLUSH_INTERVAL, flush)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+
+# Small dedicated pool so title jobs never compete with request threads,
+# created on first use
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pending_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=config.TITLE_WORKERS, thread_name_prefix="titles")
+    return _pool
+
+
+# Queue a title for a conversation after its first turn
+def enqueue(conversation_id: int, query_text: str, response_text: str):
+    future = _get_pool().submit(_generate, conversation_id, query_text, response_text)
+    with _pending_lock:
+        _jobs.add(future)
+    future.add_done_callback(_jobs.discard)
+
+
+def flush():
+    global _flush_timer
+    with _pending_lock:
+        rows = [{"b_id": cid, "b_title": title} for cid, title in _pending.items()]
+        _pending.clear()
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+    if not rows:
+        return
+
+    table = Conversations.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"), table.c.title == PLACEHOLDER_TITLE)
+        .values(title=bindparam("b_title"))
+    )
+    db = Session()
+    try:
+        db.execute(stmt, rows)
+        conversation_ids = [r["b_id"] for r in rows]
+        user_ids = [row[0] for row in db.query(Conversations.user_id).filter(Conversations.id.in_(conversation_ids))]
+        bump_history_version(db, user_ids, conversation_ids)
+        db.commit()
+        metrics.incr("titles.written", len(rows))
+    finally:
+        db.close()
+
+
+@on_shutdown
+def shutdown():
+    # queued jobs are dropped, running ones finish and are written
+    if _pool is not None:
+        with _pending_lock:
+            jobs = list(_jobs)
+        for future in jobs:
+            future.cancel()
+        _pool.shutdown(wait=True)
+    flush()
@@ -0,0 +1,37 @@
+import re
+
+# Local approximation of a BPE tokenizer (cl100k-style pre-tokenization):
+# words split into ~7 character chunks, numbers into groups of up to 3 digits,
+# and each run of punctuation counts as one token. Good enough to budget
+# context and quotas without shipping a vocabulary or calling the upstream.
+PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+")
+WORD_CHUNK = 7
+MESSAGE_OVERHEAD = 4  # role and separators per chat message
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    total = 0
+    for piece in PIECE_RE.findall(text):
+        stripped = piece.lstrip(" ")
+        if stripped and stripped[0].isalpha():
+            total += 1 + (len(stripped) - 1) // WORD_CHUNK
+        else:
+            total += 1
+    return total
+
+
+def turn_tokens(query_tokens: int, response_tokens: int) -> int:
+    return query_tokens + response_tokens + 2 * MESSAGE_OVERHEAD
+
+
+# Drop the oldest turns of a root-first path until it fits the budget,
+# using the counts stored on each row
+def trim_to_budget(path: list, budget: int) -> list:
+    total = sum(turn_tokens(q.query_tokens or 0, q.response_tokens or 0) for q in path)
+    start = 0
+    while start < len(path) and total > budget:
+        total -= turn_tokens(path[start].query_tokens or 0, path[start].response_tokens or 0)
+        start += 1
+    return path[start:]
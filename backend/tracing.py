@@ -0,0 +1,291 @@
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import config
+import metrics
+
+# Lightweight tracer that writes spans in the OTLP/JSON format, so traces can
+# go to a local file or straight to an OpenTelemetry collector without the SDK.
+# Unsampled requests only carry a correlation id and never allocate spans.
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+SERVICE_NAME = "ai-interact"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_correlation_id = contextvars.ContextVar("correlation_id", default="-")
+
+_queue = queue.Queue(maxsize=config.TRACE_QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int = 1):
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = {}
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def enabled() -> bool:
+    return config.TRACE_EXPORTER != "none" and config.TRACE_SAMPLE_RATE > 0
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def correlation_id() -> str:
+    return _correlation_id.get()
+
+
+# Start the root span of a request from incoming headers
+@contextmanager
+def start_request(name: str, headers):
+    trace_id, parent_id, sampled = None, None, None
+    match = TRACEPARENT_RE.match(headers.get("traceparent", ""))
+    if match:
+        trace_id, parent_id = match.group(1), match.group(2)
+        sampled = int(match.group(3), 16) & 1 == 1
+    if trace_id is None:
+        trace_id = "%032x" % random.getrandbits(128)
+    if sampled is None:
+        sampled = enabled() and random.random() < config.TRACE_SAMPLE_RATE
+
+    request_id = headers.get("x-request-id") or headers.get("x-correlation-id") or trace_id
+    id_token = _correlation_id.set(request_id)
+
+    if not (sampled and enabled()):
+        # keep the trace id so propagation still works, just don't record
+        span_token = _current_span.set(_Unsampled(trace_id, parent_id))
+        try:
+            yield None
+        finally:
+            _current_span.reset(span_token)
+            _correlation_id.reset(id_token)
+        return
+
+    span = Span(name, trace_id, parent_id, kind=2)
+    span.set("correlation_id", request_id)
+    span_token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.error = str(e)
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _correlation_id.reset(id_token)
+        _finish(span)
+
+
+class _Unsampled:
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str]):
+        self.trace_id = trace_id
+        self.span_id = parent_id or "%016x" % random.getrandbits(64)
+
+
+# Child span of whatever is current; a no-op outside sampled requests
+@contextmanager
+def span(name: str, kind: int = 1, **attributes):
+    parent = _current_span.get()
+    if not isinstance(parent, Span):
+        yield None
+        return
+
+    child = Span(name, parent.trace_id, parent.span_id, kind)
+    child.attributes.update(attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(child)
+
+
+def start_child(name: str, kind: int = 1) -> Optional[Span]:
+    parent = _current_span.get()
+    if not isinstance(parent, Span):
+        return None
+    return Span(name, parent.trace_id, parent.span_id, kind)
+
+
+def finish(child: Optional[Span]):
+    if child is not None:
+        _finish(child)
+
+
+def _finish(finished: Span):
+    finished.end = time.time_ns()
+    _ensure_worker()
+    try:
+        _queue.put_nowait(finished)
+    except queue.Full:
+        metrics.incr("tracing.dropped_spans")
+
+
+# Headers for outgoing calls so upstream logs line up with ours
+def propagation_headers() -> dict:
+    headers = {"X-Request-ID": _correlation_id.get()}
+    current = _current_span.get()
+    if current is not None:
+        flags = "01" if isinstance(current, Span) else "00"
+        headers["traceparent"] = f"00-{current.trace_id}-{current.span_id}-{flags}"
+    return headers
+
+
+# Export
+
+def _export(spans: list):
+    payload = {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": SERVICE_NAME},
+                "spans": [s.to_otlp() for s in spans]
+            }]
+        }]
+    }
+    if config.TRACE_EXPORTER == "file":
+        with open(config.TRACE_FILE, "a") as f:
+            f.write(json.dumps(payload) + "\n")
+    elif config.TRACE_EXPORTER == "otlp":
+        import requests
+
+        requests.post(config.TRACE_OTLP_URL, json=payload, timeout=5).raise_for_status()
+    metrics.incr("tracing.exported_spans", len(spans))
+
+
+def _drain(max_spans: int, timeout: float) -> list:
+    batch = []
+    try:
+        batch.append(_queue.get(timeout=timeout))
+        while len(batch) < max_spans:
+            batch.append(_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _run_worker():
+    while True:
+        batch = _drain(config.TRACE_BATCH_SIZE, config.TRACE_FLUSH_INTERVAL)
+        if batch:
+            try:
+                _export(batch)
+            except Exception as e:
+                metrics.incr("tracing.export_errors")
+                logging.getLogger(__name__).warning("Span export failed: %s", e)
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = threading.Thread(target=_run_worker, name="trace-exporter", daemon=True)
+                _worker.start()
+
+
+def flush():
+    while True:
+        batch = _drain(config.TRACE_BATCH_SIZE, 0)
+        if not batch:
+            return
+        _export(batch)
+
+
+# DB statements
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        child = start_child("db.query", kind=3)
+        if child is not None:
+            child.set("db.system", engine.dialect.name)
+            child.set("db.statement", statement[:500])
+            if executemany:
+                child.set("db.executemany", True)
+        conn.info.setdefault("trace_spans", []).append(child)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            finish(spans.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        spans = exception_context.connection.info.get("trace_spans") if exception_context.connection else None
+        if spans:
+            child = spans.pop()
+            if child is not None:
+                child.error = str(exception_context.original_exception)
+                finish(child)
+
+
+# Logging
+
+class CorrelationIdFilter(logging.Filter):
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+def configure_logging():
+    handler = logging.StreamHandler()
+    handler.addFilter(CorrelationIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] [%(correlation_id)s] %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(config.LOG_LEVEL)
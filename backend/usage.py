@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import QUOTA_REQUESTS_PER_MINUTE, QUOTA_TOKENS_PER_DAY
+from models import UsageRollup, Users
+
+GRANULARITIES = ("minute", "hour", "day")
+COUNTERS = ("requests", "errors", "prompt_tokens", "completion_tokens", "latency_ms")
+
+# Reporting windows for the admin endpoint and the rollup each one reads
+PERIODS = {
+    "hour": ("minute", timedelta(hours=1)),
+    "day": ("hour", timedelta(days=1)),
+    "week": ("day", timedelta(days=7)),
+    "month": ("day", timedelta(days=30)),
+}
+
+
+def bucket_start(granularity: str, now: datetime) -> datetime:
+    now = now.replace(second=0, microsecond=0)
+    if granularity in ("hour", "day"):
+        now = now.replace(minute=0)
+    if granularity == "day":
+        now = now.replace(hour=0)
+    return now
+
+
+# Add one upstream call to the user's minute, hour and day rows with a single
+# upsert, so totals never need a scan of Queries. `now` picks the buckets
+# (a refund goes to the buckets of its reservation). Callers commit.
+def record(session, user_id: int, prompt_tokens: int = 0, completion_tokens: int = 0, latency_ms: float = 0, requests: int = 1, errors: int = 0, now: datetime = None):
+    now = now or datetime.utcnow()
+    counters = {
+        "requests": requests,
+        "errors": errors,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_ms": int(latency_ms)
+    }
+    rows = [
+        {"user_id": user_id, "granularity": granularity, "bucket_start": bucket_start(granularity, now), **counters}
+        for granularity in GRANULARITIES
+    ]
+
+    insert = postgresql_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(UsageRollup).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "granularity", "bucket_start"],
+        set_={name: getattr(UsageRollup, name) + getattr(stmt.excluded, name) for name in COUNTERS}
+    )
+    session.execute(stmt)
+
+
+# Requests this minute and tokens today, read from two rollup rows
+def current_usage(session, user_id: int, now: datetime = None) -> dict:
+    now = now or datetime.utcnow()
+    minute, day = bucket_start("minute", now), bucket_start("day", now)
+    rows = (
+        session.query(UsageRollup)
+        .filter(
+            UsageRollup.user_id == user_id,
+            or_(
+                and_(UsageRollup.granularity == "minute", UsageRollup.bucket_start == minute),
+                and_(UsageRollup.granularity == "day", UsageRollup.bucket_start == day)
+            )
+        )
+    )
+    by_granularity = {row.granularity: row for row in rows}
+    minute_row, day_row = by_granularity.get("minute"), by_granularity.get("day")
+    return {
+        "requests_this_minute": minute_row.requests if minute_row else 0,
+        "tokens_today": (day_row.prompt_tokens + day_row.completion_tokens) if day_row else 0,
+        "requests_per_minute_limit": QUOTA_REQUESTS_PER_MINUTE or None,
+        "tokens_per_day_limit": QUOTA_TOKENS_PER_DAY or None
+    }
+
+
+# Refuse the call before it reaches the upstream once a limit is used up.
+# A batch passes the number of upstream calls it is about to make; `reserved`
+# says they are already counted in this minute's row.
+def check_quota(session, user_id: int, requests: int = 1, reserved: bool = False, now: datetime = None):
+    if not QUOTA_REQUESTS_PER_MINUTE and not QUOTA_TOKENS_PER_DAY:
+        return
+
+    now = now or datetime.utcnow()
+    usage = current_usage(session, user_id, now)
+    used = usage["requests_this_minute"] - (requests if reserved else 0)
+    if QUOTA_REQUESTS_PER_MINUTE and used + requests > QUOTA_REQUESTS_PER_MINUTE:
+        left = max(QUOTA_REQUESTS_PER_MINUTE - used, 0)
+        raise HTTPException(
+            status_code=429,
+            detail=(
+                f"Request quota of {QUOTA_REQUESTS_PER_MINUTE} per minute reached" if requests == 1 or not left
+                else f"Batch of {requests} queries exceeds the {left} requests left of the {QUOTA_REQUESTS_PER_MINUTE} per minute quota"
+            ),
+            headers={"Retry-After": str(60 - now.second)}
+        )
+    if QUOTA_TOKENS_PER_DAY and usage["tokens_today"] >= QUOTA_TOKENS_PER_DAY:
+        next_day = bucket_start("day", now) + timedelta(days=1)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Token quota of {QUOTA_TOKENS_PER_DAY} per day reached",
+            headers={"Retry-After": str(int((next_day - now).total_seconds()) + 1)}
+        )
+
+
+# Count upstream calls in the ledger before they are made, then check the
+# quota with them included, so concurrent requests cannot all pass on the
+# same count. A refused reservation is taken back. Returns the reservation
+# time, for refunding into the same buckets; the calls later record their
+# tokens with requests=0. Commits.
+def reserve(session, user_id: int, requests: int = 1) -> datetime:
+    now = datetime.utcnow()
+    record(session, user_id, requests=requests, now=now)
+    session.commit()
+    try:
+        check_quota(session, user_id, requests=requests, reserved=True, now=now)
+    except HTTPException:
+        record(session, user_id, requests=-requests, now=now)
+        session.commit()
+        raise
+    return now
+
+
+# Heaviest users over a reporting window, summed from the coarsest rollup that
+# covers it, so the cost grows with buckets, not with stored queries
+def top_consumers(session, period: str = "day", limit: int = 10, order_by: str = "tokens") -> list:
+    granularity, window = PERIODS[period]
+    since = bucket_start(granularity, datetime.utcnow() - window)
+
+    totals = {name: func.sum(getattr(UsageRollup, name)).label(name) for name in COUNTERS}
+    tokens = (totals["prompt_tokens"] + totals["completion_tokens"])
+    ordering = {"tokens": tokens, "requests": totals["requests"], "latency": totals["latency_ms"]}[order_by]
+
+    rows = (
+        session.query(UsageRollup.user_id, Users.name, Users.email, *totals.values())
+        .join(Users, Users.id == UsageRollup.user_id)
+        .filter(UsageRollup.granularity == granularity, UsageRollup.bucket_start >= since)
+        .group_by(UsageRollup.user_id, Users.name, Users.email)
+        .order_by(ordering.desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "user_id": row.user_id,
+            "name": row.name,
+            "email": row.email,
+            "requests": row.requests,
+            "errors": row.errors,
+            "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens,
+            "total_tokens": row.prompt_tokens + row.completion_tokens,
+            "avg_latency_ms": round(row.latency_ms / row.requests, 1) if row.requests else None
+        } for row in rows
+    ]